@@ -8,109 +8,9 @@ import ast
 import matplotlib.pyplot as plt
 import multiprocessing
 import linecache
-from numba import jit
-
-@jit(nopython=True, nogil=True)
-def stacking_mo(atom, df_numpy):
-    # Custom function to replace np.isin
-    def isin(a, b):
-        for i in a:
-            if i not in b:
-                return False
-        return True
-        
-    idx = int(atom[0])
-    vector = []
-    
-    distances = np.sqrt((df_numpy[:, 2] - atom[2]) ** 2 +  
-                            (df_numpy[:, 3] - atom[3]) ** 2)  
-
-    cent_mo = df_numpy[(distances <= r_tol) & (df_numpy[:, 1] != 4)] 
-
-    if len(cent_mo) == 0:
-        vector.append(0)
-    elif len(cent_mo) == 1:
-        if cent_mo[0][1] == 1:
-            vector.append(1)
-        else :
-            vector.append(20)
-    elif len(cent_mo) == 2:
-        if isin(cent_mo[:,1],[2, 3]):
-            vector.append(2)
-        else:
-            vector.append(20)
-    else:
-        vector.append(20)
-
-    top_s_neighbors = df_numpy[(distances <= 3.0) & (df_numpy[:, 1] == 6)]  
-    
-    if len(top_s_neighbors) == 3:
-        for s_atom in top_s_neighbors:
-            s_distances = np.sqrt((df_numpy[:, 2] - s_atom[2])**2 +  
-                            (df_numpy[:, 3] - s_atom[3])**2)
-            cent_s = df_numpy[(s_distances <= r_tol) & (df_numpy[:, 1] != 6)]
-            
-            if len(cent_s) == 0:
-                vector.append(20)
-            elif len(cent_s) == 1:
-                if (cent_s[0][1] == 5):
-                    vector.append(1)
-                else:
-                    vector.append(20)
-            elif len(cent_s) == 2:
-                if isin(cent_s[:,1],[1, 5]):
-                    vector.append(2)
-                else:
-                    vector.append(20)
-            elif len(cent_s) == 3:
-                if isin(cent_s[:,1],[2, 3, 5]):
-                    vector.append(3)
-                else:
-                    vector.append(20)
-            else:
-                vector.append(20)
-    else:
-        vector.append(20)
-
-    # vector = np.array(vector)
-    # mag = np.sum(vector)
-    
-    if vector == [1,3,3,3]:
-        s_type = "AA"
-    elif vector == [2,2,2,2]:
-        s_type = "AA'"
-    elif vector == [1,1,1,1]:
-        s_type = "A'B"
-    elif vector == [0,3,3,3]:
-        s_type = "AB'"
-    elif vector == [0,2,2,2]:
-        s_type = "AB"
-    elif vector == [2,1,1,1]:
-        s_type = "BA"
-    else:
-        s_type = "X"
-        
-
-    if s_type == "A'B":
-        s_code = 3
-    elif s_type == "BA":
-        s_code = 0
-    elif s_type == "AB":
-        s_code = 1
-    elif s_type == "AA'":
-        s_code = 2
-    elif s_type == "AB'":
-        s_code = 4
-    elif s_type == "AA":
-        s_code = 5
-    elif s_type == "X":
-        s_code = 6
-
-    
-
-    return idx,s_type,s_code
-
-
+import numba
+from stacking_analysis.core import STACKING_TYPES, build_cell_grid, classify_patch
+from stacking_analysis.io_utils import as_atom_types
 
 def process_patch(patch):
     #st = time.time()
@@ -118,18 +18,35 @@ def process_patch(patch):
     x_id, y_id = patch
     ###############################
     
-    small_df = df[(df['voxel_x'] >= (x_id - 1)) & (df['voxel_x'] <= (x_id + 1)) &
-                  (df['voxel_y'] >= (y_id - 1)) & (df['voxel_y'] <= (y_id + 1))].copy()
-    df_numpy = small_df.to_numpy()
+    # Central voxel first, then its 8 neighbors: each one is a contiguous
+    # slice of the voxel-sorted column arrays
+    start, end = voxel_ranges.get((x_id, y_id), (0, 0))
+    halo = [(start, end)] + [voxel_ranges.get((x_id + dx, y_id + dy), (0, 0))
+                             for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx != 0 or dy != 0]
+    rows = np.concatenate([np.arange(lo, hi) for lo, hi in halo])
 
     
     ###############################
     
-    target_df = df[(df['voxel_x'] == x_id) & (df['voxel_y'] == y_id)&( df['type'] == 4)].copy()
-    target_numpy = target_df.to_numpy()
-
-
-    stack_results = [stacking_mo(atom, df_numpy) for atom in target_numpy]
+    is_target = np.zeros(len(rows), dtype=np.bool_)
+    is_target[:end - start] = atom_types[start:end] == 4
+    if not is_target.any():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8)
+
+    # Uniform grid over the patch: each neighbor search only scans the 3x3 cells around the atom
+    cell = max(r_tol, 3.0)
+    xs = atom_xs[rows]
+    ys = atom_ys[rows]
+    grid = build_cell_grid(xs, ys, cell)
+    order = grid[0]
+    xs = xs[order]
+    ys = ys[order]
+    types = atom_types[rows[order]]
+    ids = atom_ids[rows[order]]
+
+    targets_idx = np.flatnonzero(is_target[order])
+    codes = classify_patch(targets_idx, xs, ys, types, grid, cell, r_tol, 3.0)
+    stack_results = (ids[targets_idx], codes)
     #ils_results_array = np.array(ils_results)
     # np.save(f"test_results/{x_id}_{y_id}", ils_results_array)
     #en = time.time()
@@ -144,16 +61,10 @@ def process_patch(patch):
 
 
 def write_xyz(filename, atom_data):
-    # Buffer for all the lines to write
-    lines = [
-        f"{len(atom_data)} \n"
-    ]
-    
-    # Write the buffer to the file
-    with open(filename, 'w') as file:
-        file.writelines(lines)
-        # Use to_csv for efficient DataFrame writing
-        atom_data.to_csv(file, sep=' ', index=False, header=True, mode='a')
+    # Count line and atom data go through one 1 MiB buffered handle
+    with open(filename, 'w', buffering=1 << 20) as file:
+        file.write(f"{len(atom_data)} \n")
+        atom_data.to_csv(file, sep=' ', index=False, header=True)
 
 ##############################################
 ############# READ STR FILE ##################
@@ -165,7 +76,18 @@ def write_xyz(filename, atom_data):
 
 cols = ["id", "type", "x", "y", "z", "fx", "fy", "fz", "c_myPE"]
 
-df = pd.read_csv(sys.argv[1], sep = " ", skiprows=9, names = cols)
+# float32 is far finer than r_tol and halves the bytes read by the distance scans.
+# type is parsed wide and range checked below, as an int8 parse wraps large types
+dtypes = {'id': 'int64', 'type': 'int64', 'x': 'float32', 'y': 'float32', 'z': 'float32'}
+
+# The multithreaded PyArrow parser is much faster on large dumps; fall back
+# to the C parser when PyArrow (or pandas >= 1.4) is not available
+try:
+    df = pd.read_csv(sys.argv[1], sep = " ", skiprows=9, names = cols, dtype=dtypes, engine='pyarrow')
+except (ImportError, ValueError):
+    df = pd.read_csv(sys.argv[1], sep = " ", skiprows=9, names = cols, dtype=dtypes)
+
+df['type'] = as_atom_types(df['type'].to_numpy())
 
 r_tol = 0.614
 
@@ -187,21 +109,33 @@ print(cols)
 df['voxel_x'] = df['x']//(150)
 df['voxel_y'] = df['y']//(150)
 
-voxel_x = df['voxel_x'].unique()
-voxel_y = df['voxel_y'].unique()
-
-l = []
-for x in voxel_x:
-    for y in voxel_y:
-        l.append([x,y])
-
-print(f"Number of patches = {len(l)}")
+# Typed column arrays read by the workers, sorted by voxel
+atom_vx = df['voxel_x'].to_numpy()
+atom_vy = df['voxel_y'].to_numpy()
+voxel_order = np.lexsort((atom_vy, atom_vx))
+atom_vx = atom_vx[voxel_order]
+atom_vy = atom_vy[voxel_order]
+atom_xs = df['x'].to_numpy(np.float32)[voxel_order]
+atom_ys = df['y'].to_numpy(np.float32)[voxel_order]
+atom_types = df['type'].to_numpy(np.int8)[voxel_order]
+atom_ids = df['id'].to_numpy(np.int64)[voxel_order]
+
+# (voxel_x, voxel_y) -> (start, end) run of its atoms in the sorted arrays
+voxel_changed = (atom_vx[1:] != atom_vx[:-1]) | (atom_vy[1:] != atom_vy[:-1])
+voxel_starts = np.concatenate(([0], np.flatnonzero(voxel_changed) + 1))
+voxel_ends = np.append(voxel_starts[1:], len(voxel_order))
+voxel_ranges = {(vx, vy): (lo, hi) for vx, vy, lo, hi in zip(atom_vx[voxel_starts].tolist(), atom_vy[voxel_starts].tolist(),
+                                                             voxel_starts.tolist(), voxel_ends.tolist())}
+
+# Only the occupied voxels that hold type 4 atoms need a patch
+patches = df[df['type'] == 4].groupby(['voxel_x', 'voxel_y'], sort=False).size().index.tolist()
+
+print(f"Number of patches = {len(patches)}")
 
 start = time.time()
 
-patches = l
-
-with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
+# One numba thread per worker: the pool already uses every core
+with multiprocessing.Pool(processes=multiprocessing.cpu_count(), initializer=numba.set_num_threads, initargs=(1,)) as pool:
     stack_result = pool.map(process_patch, patches)
 
 
@@ -211,34 +145,26 @@ print(f"Time taken : {end-start} secs")
 
 print(f" Number of atoms in type 4: {len(df[(df['type'] == 4) ])}")
 
-result_dict = {result[0]: (result[1], result[2]) for patch_results in stack_result for result in patch_results}
-
-sm = 0
-result_dict = {}
-for i in stack_result:
-    for j in i:
-        result_dict[np.int64(j[0])] = {'s_type': j[1], 'code': j[2]}
-        sm += 1
-
-sums = 0
-for key in result_dict.keys():
-    sums = sums + 1
+result_ids = np.concatenate([ids for ids, codes in stack_result])
+result_codes = np.concatenate([codes for ids, codes in stack_result])
 
-print(f" The lengths in result_dict {sm} and number of keys {sums}")
+print(f" The lengths in result_dict {len(result_ids)} and number of keys {len(np.unique(result_ids))}")
 
 
 # Create a new DataFrame from your results
-results = []
-for i in stack_result:
-    for j in i:
-        results.append({'id': np.int64(j[0]), 'S_TYPE': j[1], 'S_CODE': j[2]})
-results_df = pd.DataFrame(results)
+results_df = pd.DataFrame({'id': result_ids,
+                           'S_TYPE': pd.Categorical.from_codes(result_codes, categories=STACKING_TYPES),
+                           'S_CODE': result_codes})
 
 print(f" Length of results_df {len(results_df)}")
 
 
-# Merge the new DataFrame with the existing one
-df = pd.merge(df, results_df, on='id', how='left')
+# Attach the results to the existing DataFrame by id
+results_by_id = results_df.set_index('id')
+# S_TYPE is categorical, rebuilt from the codes (-1 marks atoms that were not classified)
+s_code = df['id'].map(results_by_id['S_CODE']).astype('Int8')
+df['S_TYPE'] = pd.Categorical.from_codes(s_code.fillna(-1).to_numpy(np.int8), categories=STACKING_TYPES)
+df['S_CODE'] = s_code
 
 
 if df.isnull().any().any():
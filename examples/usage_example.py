@@ -35,7 +35,7 @@ def example_custom_parameters():
         r_tol=0.7,              # Custom distance tolerance
         voxel_size=200.0,       # Larger voxels
         s_neighbor_distance=3.5, # Different S-neighbor distance
-        n_processes=4,          # Use 4 CPU cores
+        n_processes=1,          # Worker processes (each uses Numba threads)
         verbose=True            # Print progress
     )
     
@@ -9,7 +9,41 @@ __version__ = "1.0.0"
 __author__ = "Your Name"
 __email__ = "your.email@example.com"
 
-from .core import classify_stacking_type
-from .analyzer import StackingAnalyzer
+import importlib
 
-__all__ = ['classify_stacking_type', 'StackingAnalyzer']
+# Public names and the submodules defining them. They are imported on first
+# access, so that e.g. the header functions used by the CLI to validate a
+# file do not load Numba and pandas.
+_EXPORTS = {
+    'STACKING_TYPES': 'core',
+    'classify_stacking_type': 'core',
+    'build_cell_grid': 'core',
+    'classify_stacking_type_grid': 'core',
+    'classify_patch': 'core',
+    'classify_patch_kdtree': 'core',
+    'classify_patch_tiled': 'core',
+    'StackingAnalyzer': 'analyzer',
+}
+
+# Submodules reachable as attributes, e.g. ``stacking_analysis.io_utils``
+_SUBMODULES = ('core', 'analyzer', 'io_utils', 'dump_header')
+
+__all__ = ['STACKING_TYPES', 'classify_stacking_type', 'build_cell_grid',
+           'classify_stacking_type_grid', 'classify_patch',
+           'classify_patch_kdtree', 'classify_patch_tiled', 'StackingAnalyzer']
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_EXPORTS[name]}", __name__)
+    value = getattr(module, name)
+    # Later lookups no longer go through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,240 @@
+"""
+Compiled parser for the atom block of LAMMPS dump files.
+
+Atom lines have a fixed, whitespace-delimited numeric layout, so the
+leading ``id type x y z`` fields can be tokenized by a small Numba state
+machine running over the lines of the memory-mapped file, instead of going
+through a general purpose CSV parser.
+
+The parser deliberately runs on a single thread: files are read in the
+parent process before StackingAnalyzer forks its workers, and forking after
+Numba's parallel thread pool has started can deadlock (e.g. with the TBB
+threading layer).
+"""
+
+import numpy as np
+from numba import jit
+
+
+# Exactly representable powers of ten: mantissa / 10**k is then correctly
+# rounded for mantissas below 2**53
+_POW10 = np.array([10.0 ** k for k in range(23)])
+
+# Significant digits accumulated into the int64 mantissa
+_MAX_DIGITS = 18
+
+# Line status in parse_atom_block
+_OK = 0
+_BLANK = 1
+_ERROR = 2
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _is_space(c):
+    """Whether byte ``c`` is a field separator (space, tab or CR)."""
+    return c == 32 or c == 9 or c == 13
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _skip_space(buf, i, end):
+    """Index of the first non-separator byte in ``buf[i:end]``."""
+    while i < end and _is_space(buf[i]):
+        i += 1
+    return i
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _parse_int(buf, i, end):
+    """
+    Parse the integer token starting at ``buf[i]``.
+    
+    Returns
+    -------
+    tuple
+        (value, index after the token, ok)
+    """
+    neg = False
+    if i < end and (buf[i] == 45 or buf[i] == 43):  # '-' or '+'
+        neg = buf[i] == 45
+        i += 1
+    start = i
+    value = 0
+    while i < end and 48 <= buf[i] <= 57:
+        value = value * 10 + (buf[i] - 48)
+        i += 1
+    ok = i > start and (i == end or _is_space(buf[i]))
+    if neg:
+        value = -value
+    return value, i, ok
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _parse_float(buf, i, end):
+    """
+    Parse the decimal or scientific notation token starting at ``buf[i]``.
+    
+    Returns
+    -------
+    tuple
+        (value, index after the token, ok)
+    """
+    neg = False
+    if i < end and (buf[i] == 45 or buf[i] == 43):
+        neg = buf[i] == 45
+        i += 1
+    
+    # Value is mantissa * 10**exp10
+    mantissa = 0
+    n_digits = 0
+    exp10 = 0
+    any_digit = False
+    while i < end and 48 <= buf[i] <= 57:
+        any_digit = True
+        if n_digits < _MAX_DIGITS:
+            mantissa = mantissa * 10 + (buf[i] - 48)
+            if mantissa != 0:
+                n_digits += 1
+        else:
+            exp10 += 1
+        i += 1
+    if i < end and buf[i] == 46:  # '.'
+        i += 1
+        while i < end and 48 <= buf[i] <= 57:
+            any_digit = True
+            if n_digits < _MAX_DIGITS:
+                mantissa = mantissa * 10 + (buf[i] - 48)
+                if mantissa != 0:
+                    n_digits += 1
+                exp10 -= 1
+            i += 1
+    if not any_digit:
+        return 0.0, i, False
+    
+    if i < end and (buf[i] == 101 or buf[i] == 69):  # 'e' or 'E'
+        exponent, i, ok = _parse_int(buf, i + 1, end)
+        if not ok:
+            return 0.0, i, False
+        exp10 += exponent
+    
+    if i < end and not _is_space(buf[i]):
+        return 0.0, i, False
+    
+    value = float(mantissa)
+    if exp10 >= 0:
+        value *= _POW10[exp10] if exp10 < len(_POW10) else 10.0 ** exp10
+    else:
+        value /= _POW10[-exp10] if -exp10 < len(_POW10) else 10.0 ** -exp10
+    if neg:
+        value = -value
+    return value, i, True
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _line_bounds(buf):
+    """(start, end) byte offsets of every line in ``buf``, newline excluded."""
+    n = 0
+    for i in range(len(buf)):
+        if buf[i] == 10:
+            n += 1
+    if len(buf) > 0 and buf[len(buf) - 1] != 10:
+        n += 1
+    
+    starts = np.empty(n, dtype=np.int64)
+    ends = np.empty(n, dtype=np.int64)
+    k = 0
+    start = 0
+    for i in range(len(buf)):
+        if buf[i] == 10:
+            starts[k] = start
+            ends[k] = i
+            k += 1
+            start = i + 1
+    if k < n:
+        starts[k] = start
+        ends[k] = len(buf)
+    return starts, ends
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def parse_atom_block(buf):
+    """
+    Parse the leading ``id type x y z`` fields of every atom line.
+    
+    Fields after the fifth are skipped without being parsed.
+    
+    Parameters
+    ----------
+    buf : numpy.ndarray
+        uint8 bytes of the atom block (the file without its header)
+    
+    Returns
+    -------
+    tuple
+        (ids, types, xyz, status) with one entry (one row of ``xyz``) per
+        line of ``buf``. ``status`` is 0 for a parsed atom, 1 for a blank line and
+        2 for a line that is not a plain numeric atom record.
+    """
+    starts, ends = _line_bounds(buf)
+    n = len(starts)
+    ids = np.empty(n, dtype=np.int64)
+    types = np.empty(n, dtype=np.int8)
+    xyz = np.empty((n, 3), dtype=np.float32)
+    status = np.empty(n, dtype=np.int8)
+    
+    for k in range(n):
+        end = ends[k]
+        i = _skip_space(buf, starts[k], end)
+        if i == end:
+            status[k] = _BLANK
+            continue
+        
+        atom_id, i, ok_id = _parse_int(buf, i, end)
+        atom_type, i, ok_type = _parse_int(buf, _skip_space(buf, i, end), end)
+        x, i, ok_x = _parse_float(buf, _skip_space(buf, i, end), end)
+        y, i, ok_y = _parse_float(buf, _skip_space(buf, i, end), end)
+        z, i, ok_z = _parse_float(buf, _skip_space(buf, i, end), end)
+        
+        if (ok_id and ok_type and ok_x and ok_y and ok_z
+                and -128 <= atom_type <= 127):
+            ids[k] = atom_id
+            types[k] = atom_type
+            xyz[k, 0] = x
+            xyz[k, 1] = y
+            xyz[k, 2] = z
+            status[k] = _OK
+        else:
+            status[k] = _ERROR
+    
+    return ids, types, xyz, status
+
+
+def read_atom_block(buf):
+    """
+    Read the ids, types and coordinates of a LAMMPS dump atom block.
+    
+    Parameters
+    ----------
+    buf : numpy.ndarray
+        uint8 bytes of the atom block, e.g. a view of the memory-mapped
+        file past its header
+    
+    Returns
+    -------
+    dict or None
+        Arrays ``id`` (int64), ``type`` (int8) and ``xyz`` (float32, C-order
+        with one row per atom), or None if the block has a line this parser does not
+        handle (e.g. non-numeric fields or fewer than 5 columns)
+    """
+    ids, types, xyz, status = parse_atom_block(buf)
+    
+    if (status == _ERROR).any():
+        return None
+    
+    arrays = {'id': ids, 'type': types, 'xyz': xyz}
+    
+    # Blank lines (e.g. at the end of the file) are dropped
+    parsed = status == _OK
+    if not parsed.all():
+        arrays = {key: values[parsed] for key, values in arrays.items()}
+    
+    return arrays
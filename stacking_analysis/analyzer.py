@@ -8,9 +8,148 @@ stacking analysis on bilayer structures.
 import numpy as np
 import pandas as pd
 import multiprocessing
+from multiprocessing import shared_memory
+import numba
 import time
-from .core import classify_stacking_type
-from .io_utils import read_structure_file, write_xyz
+from .core import (STACKING_TYPES, build_cell_grid, classify_patch,
+                   classify_patch_kdtree, classify_patch_tiled)
+from .io_utils import (ANALYSIS_COLUMNS, as_atom_types, read_structure_file,
+                       write_results)
+
+
+# Per-atom columns used by the kernel
+_COLUMNS = ('xs', 'ys', 'types', 'ids')
+
+# Stacking type labels stored as categories, coded by their stacking code
+STACKING_TYPE_DTYPE = pd.CategoricalDtype(STACKING_TYPES)
+
+# Supported neighbor search methods (see StackingAnalyzer)
+NEIGHBOR_SEARCH_METHODS = ('grid', 'kdtree', 'brute')
+
+# Patch data attached by each worker process (see _init_worker)
+_worker_shm = []
+_worker_state = {}
+
+
+def _classify_voxel(patch, data, buckets, r_tol, s_neighbor_distance,
+                    neighbor_search='grid'):
+    """
+    Classify the target atoms of one voxel.
+    
+    Parameters
+    ----------
+    patch : tuple
+        (x_id, y_id) coordinates of the voxel
+    data : dict
+        Per-atom arrays ``xs``, ``ys``, ``types`` and ``ids``, sorted by
+        voxel
+    buckets : dict
+        Maps (voxel_x, voxel_y) to the (start, end) range of its atoms in
+        the arrays of ``data``
+    r_tol, s_neighbor_distance : float
+        Classification distances
+    neighbor_search : str, optional
+        Neighbor search method, 'grid' (default), 'kdtree' or 'brute'
+    
+    Returns
+    -------
+    tuple
+        (ids, codes) arrays of the target atom ids and their stacking codes
+    """
+    x_id, y_id = patch
+    
+    # Target atoms (type 4 only) are taken from the central voxel
+    start, end = buckets.get((x_id, y_id), (0, 0))
+    is_center_target = data['types'][start:end] == 4
+    
+    if not is_center_target.any():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8)
+    
+    # Neighborhood: central voxel first, then the 8 adjacent voxels, each a
+    # contiguous slice of the voxel-sorted arrays
+    halo = [(start, end)]
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            if dx != 0 or dy != 0:
+                halo.append(buckets.get((x_id + dx, y_id + dy), (0, 0)))
+    
+    xs, ys, types, ids = (
+        np.concatenate([data[key][lo:hi] for lo, hi in halo])
+        for key in _COLUMNS
+    )
+    
+    is_target = np.zeros(len(xs), dtype=np.bool_)
+    is_target[:end - start] = is_center_target
+    
+    if neighbor_search == 'kdtree':
+        targets_idx = np.flatnonzero(is_target)
+        codes = classify_patch_kdtree(targets_idx, xs, ys, types,
+                                      r_tol, s_neighbor_distance)
+        return ids[targets_idx], codes
+    
+    if neighbor_search == 'brute':
+        targets_idx = np.flatnonzero(is_target)
+        codes = classify_patch_tiled(targets_idx, xs, ys, types,
+                                     r_tol, s_neighbor_distance)
+        return ids[targets_idx], codes
+    
+    # Bucket the neighborhood into a uniform grid so that each neighbor
+    # search only scans the 3x3 cells around the query atom
+    cell = max(r_tol, s_neighbor_distance)
+    grid = build_cell_grid(xs, ys, cell)
+    order = grid[0]
+    xs = xs[order]
+    ys = ys[order]
+    types = types[order]
+    ids = ids[order]
+    
+    # Classify all target atoms in parallel
+    targets_idx = np.flatnonzero(is_target[order])
+    codes = classify_patch(targets_idx, xs, ys, types, grid, cell,
+                           r_tol, s_neighbor_distance)
+    
+    return ids[targets_idx], codes
+
+
+def _init_worker(specs, buckets, r_tol, s_neighbor_distance, neighbor_search,
+                 verbose, n_threads):
+    """
+    Attach a worker process to the shared patch data.
+    
+    ``specs`` maps each column name to the (name, shape, dtype) of its
+    shared memory block. Numba threads are limited so that processes do
+    not oversubscribe the CPUs.
+    """
+    numba.set_num_threads(n_threads)
+    
+    data = {}
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        # Keep the block mapped for the lifetime of the worker
+        _worker_shm.append(shm)
+        data[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    
+    _worker_state.update(
+        data=data,
+        buckets=buckets,
+        r_tol=r_tol,
+        s_neighbor_distance=s_neighbor_distance,
+        neighbor_search=neighbor_search,
+        verbose=verbose,
+    )
+
+
+def _process_patch_worker(patch):
+    """Pool task: classify one voxel using the shared patch data."""
+    state = _worker_state
+    result = _classify_voxel(patch, state['data'], state['buckets'],
+                             state['r_tol'], state['s_neighbor_distance'],
+                             state['neighbor_search'])
+    
+    if state['verbose']:
+        print(f"Completed patch ({patch[0]}, {patch[1]})")
+    
+    return result
 
 
 class StackingAnalyzer:
@@ -26,9 +165,17 @@ class StackingAnalyzer:
     s_neighbor_distance : float, optional
         Distance threshold for S-type neighbors (default: 3.0 Å)
     n_processes : int, optional
-        Number of parallel processes. If None, uses all available CPUs.
+        Number of worker processes (default: 1). Atoms within each patch
+        are classified in parallel using Numba threads, so a single process
+        already uses all available CPUs; with several processes the threads
+        are split evenly between them.
     verbose : bool, optional
         Print progress information (default: True)
+    neighbor_search : str, optional
+        How neighbors are found within a patch: 'grid' (default) bins the
+        atoms into a uniform grid of cells; 'kdtree' uses a
+        ``scipy.spatial.cKDTree`` (requires SciPy); 'brute' scans every
+        atom of the patch for each query, in cache-sized tiles.
     
     Attributes
     ----------
@@ -39,17 +186,30 @@ class StackingAnalyzer:
     """
     
     def __init__(self, r_tol=0.614, voxel_size=150.0, 
-                 s_neighbor_distance=3.0, n_processes=None, verbose=True):
+                 s_neighbor_distance=3.0, n_processes=None, verbose=True,
+                 neighbor_search='grid'):
+        if neighbor_search not in NEIGHBOR_SEARCH_METHODS:
+            raise ValueError(
+                f"neighbor_search must be one of {NEIGHBOR_SEARCH_METHODS}, "
+                f"got '{neighbor_search}'"
+            )
+        
         self.r_tol = r_tol
         self.voxel_size = voxel_size
         self.s_neighbor_distance = s_neighbor_distance
-        self.n_processes = n_processes or multiprocessing.cpu_count()
+        self.n_processes = n_processes or 1
+        self.neighbor_search = neighbor_search
         self.verbose = verbose
         
         self.df = None
         self.results_df = None
+        
+        # Per-atom columns and voxel buckets, only set during analyze()
+        self._patch_data = None
+        self._buckets = None
     
-    def load_structure(self, filepath, skiprows=9, columns=None):
+    def load_structure(self, filepath, skiprows=9, columns=None,
+                       usecols=ANALYSIS_COLUMNS):
         """
         Load atomic structure from file.
         
@@ -61,6 +221,10 @@ class StackingAnalyzer:
             Number of header rows to skip (default: 9)
         columns : list, optional
             Column names for the file
+        usecols : list, optional
+            Columns to read (default: id, type, x, y, z). Pass a superset
+            to keep additional columns in the saved results, or None to
+            read every column.
         
         Returns
         -------
@@ -70,7 +234,7 @@ class StackingAnalyzer:
         if self.verbose:
             print(f"Loading structure from {filepath}...")
         
-        self.df = read_structure_file(filepath, skiprows, columns)
+        self.df = read_structure_file(filepath, skiprows, columns, usecols)
         
         if self.verbose:
             print(f"Loaded {len(self.df)} atoms")
@@ -78,64 +242,114 @@ class StackingAnalyzer:
         
         return self
     
+    def _threads_per_process(self):
+        """Number of Numba threads available to each worker process."""
+        return max(1, numba.config.NUMBA_NUM_THREADS // self.n_processes)
+    
     def _create_voxels(self):
         """Create spatial voxel partitions for parallel processing."""
         self.df['voxel_x'] = self.df['x'] // self.voxel_size
         self.df['voxel_y'] = self.df['y'] // self.voxel_size
         
-        voxel_x = self.df['voxel_x'].unique()
-        voxel_y = self.df['voxel_y'].unique()
-        
-        patches = [[x, y] for x in voxel_x for y in voxel_y]
+        # Only voxels holding target (type 4) atoms need to be processed
+        patches = list(
+            self.df.loc[self.df['type'] == 4, ['voxel_x', 'voxel_y']]
+            .drop_duplicates()
+            .itertuples(index=False, name=None)
+        )
         
         if self.verbose:
             print(f"Created {len(patches)} spatial patches")
         
         return patches
     
+    def _bucket_atoms(self):
+        """
+        Extract the per-atom columns used by the kernel, sorted by voxel, so
+        that patches can gather their neighborhood as contiguous slices
+        instead of scanning the whole DataFrame.
+        """
+        voxel_x = self.df['voxel_x'].to_numpy()
+        voxel_y = self.df['voxel_y'].to_numpy()
+        order = np.lexsort((voxel_y, voxel_x))
+        voxel_x = voxel_x[order]
+        voxel_y = voxel_y[order]
+        
+        # Each (voxel_x, voxel_y) is a run of the sorted arrays
+        changed = (voxel_x[1:] != voxel_x[:-1]) | (voxel_y[1:] != voxel_y[:-1])
+        starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+        ends = np.append(starts[1:], len(order))
+        self._buckets = {
+            (vx, vy): (start, end)
+            for vx, vy, start, end in zip(voxel_x[starts].tolist(),
+                                          voxel_y[starts].tolist(),
+                                          starts.tolist(), ends.tolist())
+        }
+        
+        self._patch_data = {
+            'xs': self.df['x'].to_numpy(np.float32)[order],
+            'ys': self.df['y'].to_numpy(np.float32)[order],
+            'types': as_atom_types(self.df['type'].to_numpy())[order],
+            'ids': self.df['id'].to_numpy(np.int64)[order],
+        }
+    
     def _process_patch(self, patch):
         """
         Process a single spatial patch.
         
         Parameters
         ----------
-        patch : list
-            [x_id, y_id] coordinates of the patch
+        patch : tuple
+            (x_id, y_id) coordinates of the patch
         
         Returns
         -------
-        list
-            List of (atom_id, stacking_type, stacking_code) tuples
+        tuple
+            (ids, codes) arrays of the target atom ids and stacking codes
         """
-        x_id, y_id = patch
-        
-        # Extract neighborhood (including adjacent voxels)
-        small_df = self.df[
-            (self.df['voxel_x'] >= (x_id - 1)) & 
-            (self.df['voxel_x'] <= (x_id + 1)) &
-            (self.df['voxel_y'] >= (y_id - 1)) & 
-            (self.df['voxel_y'] <= (y_id + 1))
-        ].copy()
-        df_numpy = small_df.to_numpy()
-        
-        # Extract target atoms (type 4 only)
-        target_df = self.df[
-            (self.df['voxel_x'] == x_id) & 
-            (self.df['voxel_y'] == y_id) & 
-            (self.df['type'] == 4)
-        ].copy()
-        target_numpy = target_df.to_numpy()
-        
-        # Classify each target atom
-        results = [
-            classify_stacking_type(atom, df_numpy, self.r_tol, self.s_neighbor_distance) 
-            for atom in target_numpy
-        ]
+        result = _classify_voxel(patch, self._patch_data, self._buckets,
+                                 self.r_tol, self.s_neighbor_distance,
+                                 self.neighbor_search)
         
         if self.verbose:
-            print(f"Completed patch ({x_id}, {y_id})")
+            print(f"Completed patch ({patch[0]}, {patch[1]})")
+        
+        return result
+    
+    def _process_patches_shared(self, patches):
+        """
+        Process patches in a worker pool.
         
-        return results
+        The per-atom arrays are copied once into shared memory that every
+        worker attaches to, so tasks only carry the voxel coordinates
+        instead of pickling the analyzer and its DataFrame.
+        """
+        blocks = []
+        try:
+            specs = {}
+            for key in _COLUMNS:
+                array = self._patch_data[key]
+                shm = shared_memory.SharedMemory(create=True,
+                                                 size=max(array.nbytes, 1))
+                blocks.append(shm)
+                np.ndarray(array.shape, dtype=array.dtype,
+                           buffer=shm.buf)[:] = array
+                specs[key] = (shm.name, array.shape, array.dtype.str)
+            
+            chunksize = max(1, len(patches) // (4 * self.n_processes))
+            with multiprocessing.Pool(
+                processes=self.n_processes,
+                initializer=_init_worker,
+                initargs=(specs, self._buckets, self.r_tol,
+                          self.s_neighbor_distance, self.neighbor_search,
+                          self.verbose, self._threads_per_process())
+            ) as pool:
+                return list(pool.imap_unordered(_process_patch_worker,
+                                                patches, chunksize=chunksize))
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
     
     def analyze(self):
         """
@@ -156,45 +370,62 @@ class StackingAnalyzer:
         
         if self.verbose:
             print("\nStarting stacking analysis...")
-            print(f"Using {self.n_processes} CPU cores")
+            print(f"Using {self.n_processes} process(es) with "
+                  f"{self._threads_per_process()} thread(s) each")
         
         # Create spatial patches
         patches = self._create_voxels()
+        self._bucket_atoms()
         
         # Process patches in parallel
         start_time = time.time()
         
-        with multiprocessing.Pool(processes=self.n_processes) as pool:
-            stack_results = pool.map(self._process_patch, patches)
+        if self.n_processes == 1:
+            stack_results = [self._process_patch(patch) for patch in patches]
+        else:
+            stack_results = self._process_patches_shared(patches)
         
         elapsed_time = time.time() - start_time
         
+        self._patch_data = self._buckets = None
+        
         if self.verbose:
             print(f"\nAnalysis completed in {elapsed_time:.2f} seconds")
         
         # Convert results to DataFrame
-        results = []
-        for patch_results in stack_results:
-            for atom_id, s_type, s_code in patch_results:
-                results.append({
-                    'id': np.int64(atom_id),
-                    'S_TYPE': s_type,
-                    'S_CODE': s_code
-                })
-        
-        self.results_df = pd.DataFrame(results)
+        ids = np.concatenate(
+            [np.empty(0, dtype=np.int64)] + [ids for ids, _ in stack_results]
+        )
+        codes = np.concatenate(
+            [np.empty(0, dtype=np.int8)] + [codes for _, codes in stack_results]
+        )
+        
+        self.results_df = pd.DataFrame({
+            'id': ids,
+            'S_TYPE': pd.Categorical.from_codes(codes, dtype=STACKING_TYPE_DTYPE),
+            'S_CODE': codes
+        })
         
         if self.verbose:
             print(f"Classified {len(self.results_df)} atoms")
             print("\nStacking type distribution:")
-            print(self.results_df['S_TYPE'].value_counts().sort_index())
-        
-        # Merge results with original data
-        self.df = pd.merge(self.df, self.results_df, on='id', how='left')
+            counts = self.results_df['S_TYPE'].value_counts().sort_index()
+            print(counts[counts > 0])
+        
+        # Attach results to the original data by id (ids are unique, so a
+        # lookup through an id-indexed Series avoids a full merge)
+        # The categorical S_TYPE is rebuilt from the codes, with unclassified
+        # atoms (code -1) left missing
+        results_by_id = self.results_df.set_index('id')
+        s_code = self.df['id'].map(results_by_id['S_CODE']).astype('Int8')
+        self.df['S_TYPE'] = pd.Categorical.from_codes(
+            s_code.fillna(-1).to_numpy(np.int8), dtype=STACKING_TYPE_DTYPE
+        )
+        self.df['S_CODE'] = s_code
         
         return self
     
-    def save_results(self, output_path, atom_type=4):
+    def save_results(self, output_path, atom_type=4, output_format=None):
         """
         Save analysis results to file.
         
@@ -204,6 +435,10 @@ class StackingAnalyzer:
             Path to output file
         atom_type : int, optional
             Filter results to specific atom type (default: 4)
+        output_format : str, optional
+            'xyz', 'csv', 'parquet' or 'npy'. If None (default), inferred
+            from the suffix of ``output_path``, with xyz for ``.stack``
+            and other suffixes.
         
         Returns
         -------
@@ -217,7 +452,7 @@ class StackingAnalyzer:
         output_df = self.df[self.df['type'] == atom_type].copy()
         
         # Write to file
-        write_xyz(output_path, output_df)
+        write_results(output_path, output_df, output_format)
         
         if self.verbose:
             print(f"\nResults saved to {output_path}")
@@ -237,7 +472,9 @@ class StackingAnalyzer:
         if self.results_df is None:
             raise ValueError("No results available. Run analyze() first.")
         
+        # Only the stacking types that occur
         counts = self.results_df['S_TYPE'].value_counts()
+        counts = counts[counts > 0]
         total = len(self.results_df)
         
         stats = {
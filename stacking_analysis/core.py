@@ -6,10 +6,158 @@ and classifying stacking configurations in bilayer materials.
 """
 
 import numpy as np
-from numba import jit
+from numba import jit, prange
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # SciPy is only needed for classify_patch_kdtree
+    cKDTree = None
+
+
+# Stacking type names, indexed by stacking code
+STACKING_TYPES = ("BA", "AB", "AA'", "A'B", "AB'", "AA", "X")
+
+# Stacking code of unclassified atoms
+_X_CODE = 6
+
+# Sentinel signature element for an unrecognised local configuration
+_INVALID = 20
+
+# Block sizes of the tiled full scan (classify_patch_tiled): targets per
+# block and atoms per tile, small enough for a tile of coordinates to stay
+# in L1 cache while every target of the block is tested against it
+_TILE_TARGETS = 64
+_TILE_ATOMS = 1024
+
+# Signature (central Mo element, then one element per top S neighbor) of
+# each recognised stacking type
+_SIGNATURES = {
+    "AA": (1, 3, 3, 3),
+    "AA'": (2, 2, 2, 2),
+    "A'B": (1, 1, 1, 1),
+    "AB'": (0, 3, 3, 3),
+    "AB": (0, 2, 2, 2),
+    "BA": (2, 1, 1, 1),
+}
+
+
+def _build_signature_table():
+    """
+    Lookup table from packed signature to stacking code.
+    
+    Valid signature elements are 0-3, so a signature packs into 2-bit fields
+    ``(v0 << 6) | (v1 << 4) | (v2 << 2) | v3``. Unknown signatures map to
+    the X code.
+    """
+    table = np.full(256, _X_CODE, dtype=np.int8)
+    for s_type, signature in _SIGNATURES.items():
+        key = 0
+        for v in signature:
+            key = (key << 2) | v
+        table[key] = STACKING_TYPES.index(s_type)
+    return table
+
+
+_SIG_TO_CODE = _build_signature_table()
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _classify_mo(n, n_type1, n_type23):
+    """
+    Signature element for the atoms found below a target Mo atom.
+    
+    ``n`` is the number of non-type-4 atoms within ``r_tol``, of which
+    ``n_type1`` are type 1 and ``n_type23`` are type 2 or 3. Returns 0, 1
+    or 2 for the recognised configurations and ``_INVALID`` otherwise.
+    """
+    if n == 0:
+        return 0
+    elif n == 1 and n_type1 == 1:
+        return 1
+    elif n == 2 and n_type23 == 2:
+        return 2
+    return _INVALID
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _classify_s(n, n_type5, n_type15, n_type235):
+    """
+    Signature element for the atoms found below a top-layer S atom.
+    
+    ``n`` is the number of non-type-6 atoms within ``r_tol``; the other
+    arguments count how many of them are of type 5, of type 1 or 5 and of
+    type 2, 3 or 5. Returns 1, 2 or 3 for the recognised configurations
+    and ``_INVALID`` otherwise.
+    """
+    if n == 1 and n_type5 == 1:
+        return 1
+    elif n == 2 and n_type15 == 2:
+        return 2
+    elif n == 3 and n_type235 == 3:
+        return 3
+    return _INVALID
+
+
+@jit(nopython=True, nogil=True, cache=True, fastmath=True)
+def _scan_target(qx, qy, xs, ys, types, start, end, r_tol2, s_nbr2,
+                 counts, top_s):
+    """
+    Single pass over atoms ``start:end`` around a target Mo atom.
+    
+    Accumulates into ``counts`` the number of non-type-4 atoms within
+    ``r_tol`` (``counts[0]``), how many of those are type 1 (``counts[1]``)
+    or type 2/3 (``counts[2]``), and the number of type-6 atoms within
+    ``s_neighbor_distance`` (``counts[3]``). The indices of the first three
+    type-6 atoms are stored in ``top_s``.
+    
+    Compiled with ``fastmath`` so that LLVM may vectorize the distance
+    arithmetic; ``xs`` and ``ys`` should be contiguous.
+    """
+    for j in range(start, end):
+        dx = xs[j] - qx
+        dy = ys[j] - qy
+        d2 = dx * dx + dy * dy
+        t = types[j]
+        if t != 4 and d2 <= r_tol2:
+            counts[0] += 1
+            if t == 1:
+                counts[1] += 1
+            elif t == 2 or t == 3:
+                counts[2] += 1
+        if t == 6 and d2 <= s_nbr2:
+            if counts[3] < 3:
+                top_s[counts[3]] = j
+            counts[3] += 1
+
+
+@jit(nopython=True, nogil=True, cache=True, fastmath=True)
+def _scan_s(qx, qy, xs, ys, types, start, end, r_tol2, counts):
+    """
+    Single pass over atoms ``start:end`` around a top-layer S atom.
+    
+    Accumulates into ``counts`` the number of non-type-6 atoms within
+    ``r_tol`` (``counts[0]``) and how many of those are type 5
+    (``counts[1]``), type 1 or 5 (``counts[2]``) and type 2, 3 or 5
+    (``counts[3]``).
+    """
+    for j in range(start, end):
+        t = types[j]
+        if t == 6:
+            continue
+        dx = xs[j] - qx
+        dy = ys[j] - qy
+        if dx * dx + dy * dy <= r_tol2:
+            counts[0] += 1
+            if t == 5:
+                counts[1] += 1
+                counts[2] += 1
+                counts[3] += 1
+            elif t == 1:
+                counts[2] += 1
+            elif t == 2 or t == 3:
+                counts[3] += 1
 
 
-@jit(nopython=True, nogil=True)
 def classify_stacking_type(atom, df_numpy, r_tol=0.614, s_neighbor_distance=3.0):
     """
     Classify the stacking type for a given atom based on its local environment.
@@ -47,99 +195,398 @@ def classify_stacking_type(atom, df_numpy, r_tol=0.614, s_neighbor_distance=3.0)
     - X (unclassified): 6
     """
     
-    # Custom function to replace np.isin for numba compatibility
-    def isin(a, b):
-        """Check if all elements in a are in b."""
-        for i in a:
-            if i not in b:
-                return False
-        return True
-    
     idx = int(atom[0])
-    vector = []
-    
-    # Calculate distances to all atoms in xy-plane
-    distances = np.sqrt((df_numpy[:, 2] - atom[2]) ** 2 +  
-                        (df_numpy[:, 3] - atom[3]) ** 2)  
-
-    # Find central Mo atoms (type != 4)
-    cent_mo = df_numpy[(distances <= r_tol) & (df_numpy[:, 1] != 4)] 
-
-    # Classify central Mo configuration
-    if len(cent_mo) == 0:
-        vector.append(0)
-    elif len(cent_mo) == 1:
-        if cent_mo[0][1] == 1:
-            vector.append(1)
-        else:
-            vector.append(20)
-    elif len(cent_mo) == 2:
-        if isin(cent_mo[:, 1], [2, 3]):
-            vector.append(2)
-        else:
-            vector.append(20)
-    else:
-        vector.append(20)
-
-    # Find top S neighbors (type == 6)
-    top_s_neighbors = df_numpy[(distances <= s_neighbor_distance) & (df_numpy[:, 1] == 6)]  
+    # Contiguous columns keep the scan loops unit-stride
+    xs = np.ascontiguousarray(df_numpy[:, 2])
+    ys = np.ascontiguousarray(df_numpy[:, 3])
+    types = np.ascontiguousarray(df_numpy[:, 1])
+    s_code = _classify_scan(atom[2], atom[3], xs, ys, types,
+                            r_tol, s_neighbor_distance)
+    
+    return idx, STACKING_TYPES[s_code], s_code
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _classify_scan(ax, ay, xs, ys, types, r_tol, s_neighbor_distance):
+    """
+    Classify the atom at ``(ax, ay)`` by scanning every atom in ``xs, ys``.
+    
+    ``xs``, ``ys`` and ``types`` are 1D column arrays (structure of arrays).
+    Each query is a single fused pass that counts neighbor categories
+    directly, without building masks or gathered sub-arrays.
+    
+    Returns
+    -------
+    int
+        Stacking code (0-6)
+    """
+    r_tol2 = r_tol * r_tol
+    s_nbr2 = s_neighbor_distance * s_neighbor_distance
+    n = len(xs)
+    
+    # Central Mo atoms (type != 4) and top S neighbors (type == 6)
+    counts = np.zeros(4, dtype=np.int64)
+    top_s = np.empty(3, dtype=np.int64)
+    _scan_target(ax, ay, xs, ys, types, 0, n, r_tol2, s_nbr2, counts, top_s)
+    key = _classify_mo(counts[0], counts[1], counts[2])
+    
+    # Any unrecognised element makes the atom unclassified, so the
+    # remaining scans can be skipped
+    if key == _INVALID or counts[3] != 3:
+        return _X_CODE
+    
+    # Analyze each S neighbor
+    for k in range(3):
+        s_counts = np.zeros(4, dtype=np.int64)
+        _scan_s(xs[top_s[k]], ys[top_s[k]], xs, ys, types, 0, n,
+                r_tol2, s_counts)
+        v = _classify_s(s_counts[0], s_counts[1], s_counts[2], s_counts[3])
+        if v == _INVALID:
+            return _X_CODE
+        key = (key << 2) | v
+    
+    return _SIG_TO_CODE[key]
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def build_cell_grid(xs, ys, cell):
+    """
+    Bin atoms into a uniform 2D grid of square cells (a cell list).
+    
+    Atoms are bucketed by ``(x // cell, y // cell)`` relative to the lower
+    left corner of the point cloud. Any pair of atoms closer than ``cell``
+    then lies in the same or in adjacent cells, so a neighbor query only has
+    to visit the 3x3 block of cells around the query point.
+    
+    Parameters
+    ----------
+    xs, ys : numpy.ndarray
+        x and y coordinates of the atoms
+    cell : float
+        Cell edge length. Must be at least the largest query radius.
+    
+    Returns
+    -------
+    tuple
+        (order, cell_start, x0, y0, nx, ny) where ``order`` sorts the atoms
+        by cell (row-major, y then x), ``cell_start`` holds the offset of
+        each cell into ``order`` (length ``nx * ny + 1``), ``x0, y0`` is the
+        grid origin and ``nx, ny`` are the grid dimensions.
+    """
+    n = len(xs)
+    x0 = xs.min()
+    y0 = ys.min()
+    nx = int((xs.max() - x0) // cell) + 1
+    ny = int((ys.max() - y0) // cell) + 1
+    
+    cell_ids = np.empty(n, dtype=np.int64)
+    cell_start = np.zeros(nx * ny + 1, dtype=np.int64)
+    for j in range(n):
+        c = int((ys[j] - y0) // cell) * nx + int((xs[j] - x0) // cell)
+        cell_ids[j] = c
+        cell_start[c + 1] += 1
+    
+    for c in range(nx * ny):
+        cell_start[c + 1] += cell_start[c]
+    
+    order = np.argsort(cell_ids, kind='mergesort')
+    
+    return order, cell_start, x0, y0, nx, ny
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _grid_rows(qx, qy, grid, cell):
+    """
+    Index ranges covering the 3x3 cell window around ``(qx, qy)``.
+    
+    Returns a (3, 2) array of ``[start, end)`` offsets into the cell-sorted
+    arrays, one per grid row; rows outside the grid are empty ranges.
+    """
+    _, cell_start, x0, y0, nx, ny = grid
+    cx = int((qx - x0) // cell)
+    cy = int((qy - y0) // cell)
+    x_lo = max(cx - 1, 0)
+    x_hi = min(cx + 1, nx - 1)
+    
+    rows = np.zeros((3, 2), dtype=np.int64)
+    for k in range(3):
+        gy = cy - 1 + k
+        if 0 <= gy < ny:
+            # The three cells of a grid row are contiguous in sorted order
+            rows[k, 0] = cell_start[gy * nx + x_lo]
+            rows[k, 1] = cell_start[gy * nx + x_hi + 1]
+    
+    return rows
+
+
+def classify_stacking_type_grid(atom_idx, xs, ys, types, grid, cell,
+                                r_tol=0.614, s_neighbor_distance=3.0):
+    """
+    Classify the stacking type of one atom using a uniform grid index.
+    
+    Equivalent to :func:`classify_stacking_type`, but neighbor searches only
+    visit the 3x3 block of grid cells around each query point instead of
+    every atom in the neighborhood.
+    
+    Parameters
+    ----------
+    atom_idx : int
+        Index of the target atom in the cell-sorted arrays
+    xs, ys : numpy.ndarray
+        Cell-sorted x and y coordinates of all atoms in the neighborhood
+    types : numpy.ndarray
+        Cell-sorted atom types
+    grid : tuple
+        Grid returned by :func:`build_cell_grid`
+    cell : float
+        Cell edge length used to build ``grid``
+        (at least ``max(r_tol, s_neighbor_distance)``)
+    r_tol : float, optional
+        Distance tolerance for neighbor identification (default: 0.614)
+    s_neighbor_distance : float, optional
+        Distance threshold for S-type neighbors (default: 3.0)
+    
+    Returns
+    -------
+    tuple
+        (stacking_type, stacking_code)
+    """
+    code = _classify_one(atom_idx, xs, ys, types, grid, cell, r_tol,
+                         s_neighbor_distance)
+    
+    return STACKING_TYPES[code], code
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _classify_one(atom_idx, xs, ys, types, grid, cell, r_tol,
+                  s_neighbor_distance):
+    """Stacking code of one atom (see :func:`classify_stacking_type_grid`)."""
+    ax = xs[atom_idx]
+    ay = ys[atom_idx]
+    r_tol2 = r_tol * r_tol
+    s_nbr2 = s_neighbor_distance * s_neighbor_distance
+    
+    # Central Mo atoms (type != 4) and top S neighbors (type == 6)
+    counts = np.zeros(4, dtype=np.int64)
+    top_s = np.empty(3, dtype=np.int64)
+    rows = _grid_rows(ax, ay, grid, cell)
+    for k in range(3):
+        _scan_target(ax, ay, xs, ys, types, rows[k, 0], rows[k, 1],
+                     r_tol2, s_nbr2, counts, top_s)
+    key = _classify_mo(counts[0], counts[1], counts[2])
+    
+    if key == _INVALID or counts[3] != 3:
+        return _X_CODE
     
     # Analyze each S neighbor
-    if len(top_s_neighbors) == 3:
-        for s_atom in top_s_neighbors:
-            s_distances = np.sqrt((df_numpy[:, 2] - s_atom[2])**2 +  
-                                  (df_numpy[:, 3] - s_atom[3])**2)
-            cent_s = df_numpy[(s_distances <= r_tol) & (df_numpy[:, 1] != 6)]
-            
-            if len(cent_s) == 0:
-                vector.append(20)
-            elif len(cent_s) == 1:
-                if cent_s[0][1] == 5:
-                    vector.append(1)
-                else:
-                    vector.append(20)
-            elif len(cent_s) == 2:
-                if isin(cent_s[:, 1], [1, 5]):
-                    vector.append(2)
-                else:
-                    vector.append(20)
-            elif len(cent_s) == 3:
-                if isin(cent_s[:, 1], [2, 3, 5]):
-                    vector.append(3)
-                else:
-                    vector.append(20)
-            else:
-                vector.append(20)
-    else:
-        vector.append(20)
-
-    # Determine stacking type from vector signature
-    if vector == [1, 3, 3, 3]:
-        s_type = "AA"
-    elif vector == [2, 2, 2, 2]:
-        s_type = "AA'"
-    elif vector == [1, 1, 1, 1]:
-        s_type = "A'B"
-    elif vector == [0, 3, 3, 3]:
-        s_type = "AB'"
-    elif vector == [0, 2, 2, 2]:
-        s_type = "AB"
-    elif vector == [2, 1, 1, 1]:
-        s_type = "BA"
-    else:
-        s_type = "X"
-    
-    # Map stacking type to numeric code
-    stacking_codes = {
-        "A'B": 3,
-        "BA": 0,
-        "AB": 1,
-        "AA'": 2,
-        "AB'": 4,
-        "AA": 5,
-        "X": 6
-    }
-    
-    s_code = stacking_codes[s_type]
-    
-    return idx, s_type, s_code
+    for k in range(3):
+        sx = xs[top_s[k]]
+        sy = ys[top_s[k]]
+        s_counts = np.zeros(4, dtype=np.int64)
+        rows = _grid_rows(sx, sy, grid, cell)
+        for m in range(3):
+            _scan_s(sx, sy, xs, ys, types, rows[m, 0], rows[m, 1],
+                    r_tol2, s_counts)
+        v = _classify_s(s_counts[0], s_counts[1], s_counts[2], s_counts[3])
+        if v == _INVALID:
+            return _X_CODE
+        key = (key << 2) | v
+    
+    return _SIG_TO_CODE[key]
+
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def classify_patch(targets_idx, xs, ys, types, grid, cell, r_tol=0.614,
+                   s_neighbor_distance=3.0):
+    """
+    Classify all target atoms of a patch in parallel.
+    
+    Parameters
+    ----------
+    targets_idx : numpy.ndarray
+        Indices of the target atoms in the cell-sorted arrays
+    xs, ys, types, grid, cell
+        Cell-sorted neighborhood and its grid, as for
+        :func:`classify_stacking_type_grid`
+    r_tol : float, optional
+        Distance tolerance for neighbor identification (default: 0.614)
+    s_neighbor_distance : float, optional
+        Distance threshold for S-type neighbors (default: 3.0)
+    
+    Returns
+    -------
+    numpy.ndarray
+        Stacking code (0-6) of each target atom, as int8. Use
+        ``STACKING_TYPES[code]`` for the stacking type name.
+    """
+    n = len(targets_idx)
+    codes = np.empty(n, dtype=np.int8)
+    for i in prange(n):
+        codes[i] = _classify_one(targets_idx[i], xs, ys, types, grid, cell,
+                                 r_tol, s_neighbor_distance)
+    
+    return codes
+
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def classify_patch_tiled(targets_idx, xs, ys, types, r_tol=0.614,
+                         s_neighbor_distance=3.0):
+    """
+    Classify all target atoms of a patch with a cache-blocked full scan.
+    
+    Alternative to :func:`classify_patch` that needs no spatial index.
+    Every query still tests every atom in the neighborhood, but targets are
+    processed in blocks of ``_TILE_TARGETS`` and the atoms in tiles of
+    ``_TILE_ATOMS``. Each tile of coordinates is therefore loaded once per
+    block of targets instead of once per query.
+    
+    Parameters
+    ----------
+    targets_idx : numpy.ndarray
+        Indices of the target atoms in ``xs, ys, types``
+    xs, ys : numpy.ndarray
+        x and y coordinates of all atoms in the neighborhood
+    types : numpy.ndarray
+        Atom types
+    r_tol : float, optional
+        Distance tolerance for neighbor identification (default: 0.614)
+    s_neighbor_distance : float, optional
+        Distance threshold for S-type neighbors (default: 3.0)
+    
+    Returns
+    -------
+    numpy.ndarray
+        Stacking code (0-6) of each target atom, as int8
+    """
+    r_tol2 = r_tol * r_tol
+    s_nbr2 = s_neighbor_distance * s_neighbor_distance
+    n = len(xs)
+    n_targets = len(targets_idx)
+    n_blocks = (n_targets + _TILE_TARGETS - 1) // _TILE_TARGETS
+    codes = np.empty(n_targets, dtype=np.int8)
+    
+    for b in prange(n_blocks):
+        lo = b * _TILE_TARGETS
+        m = min(lo + _TILE_TARGETS, n_targets) - lo
+        
+        # Pass 1: central Mo atoms and top S neighbors of each target
+        counts = np.zeros((m, 4), dtype=np.int64)
+        top_s = np.empty((m, 3), dtype=np.int64)
+        for j0 in range(0, n, _TILE_ATOMS):
+            j1 = min(j0 + _TILE_ATOMS, n)
+            for k in range(m):
+                t = targets_idx[lo + k]
+                _scan_target(xs[t], ys[t], xs, ys, types, j0, j1,
+                             r_tol2, s_nbr2, counts[k], top_s[k])
+        
+        keys = np.empty(m, dtype=np.int64)
+        for k in range(m):
+            keys[k] = _classify_mo(counts[k, 0], counts[k, 1], counts[k, 2])
+            if keys[k] == _INVALID or counts[k, 3] != 3:
+                keys[k] = -1
+        
+        # Pass 2: neighbors of the top S atoms, skipping unclassified targets
+        s_counts = np.zeros((m, 3, 4), dtype=np.int64)
+        for j0 in range(0, n, _TILE_ATOMS):
+            j1 = min(j0 + _TILE_ATOMS, n)
+            for k in range(m):
+                if keys[k] < 0:
+                    continue
+                for q in range(3):
+                    s_idx = top_s[k, q]
+                    _scan_s(xs[s_idx], ys[s_idx], xs, ys, types, j0, j1,
+                            r_tol2, s_counts[k, q])
+        
+        for k in range(m):
+            code = _X_CODE
+            key = keys[k]
+            if key >= 0:
+                for q in range(3):
+                    v = _classify_s(s_counts[k, q, 0], s_counts[k, q, 1],
+                                    s_counts[k, q, 2], s_counts[k, q, 3])
+                    if v == _INVALID:
+                        key = -1
+                        break
+                    key = (key << 2) | v
+                if key >= 0:
+                    code = _SIG_TO_CODE[key]
+            codes[lo + k] = code
+    
+    return codes
+
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def _classify_candidates(targets_idx, offsets, candidates, xs, ys, types,
+                         r_tol, s_neighbor_distance):
+    """
+    Classify target atoms from precomputed candidate neighbor lists.
+    
+    The candidates of target ``i`` are ``candidates[offsets[i]:offsets[i+1]]``
+    and must include every atom within ``s_neighbor_distance + r_tol`` of
+    it, which covers both the target and its top S neighbor queries.
+    """
+    n = len(targets_idx)
+    codes = np.empty(n, dtype=np.int8)
+    for i in prange(n):
+        rows = candidates[offsets[i]:offsets[i + 1]]
+        t = targets_idx[i]
+        codes[i] = _classify_scan(xs[t], ys[t], xs[rows], ys[rows],
+                                  types[rows], r_tol, s_neighbor_distance)
+    
+    return codes
+
+
+def classify_patch_kdtree(targets_idx, xs, ys, types, r_tol=0.614,
+                          s_neighbor_distance=3.0):
+    """
+    Classify all target atoms of a patch using a KD-tree (requires SciPy).
+    
+    Alternative to :func:`classify_patch` that does not need a grid. A
+    ``scipy.spatial.cKDTree`` is built once over the neighborhood, and a
+    single ball query per target collects every atom within
+    ``s_neighbor_distance + r_tol``. The classification then only scans
+    these short candidate lists.
+    
+    Parameters
+    ----------
+    targets_idx : numpy.ndarray
+        Indices of the target atoms in ``xs, ys, types``
+    xs, ys : numpy.ndarray
+        x and y coordinates of all atoms in the neighborhood
+    types : numpy.ndarray
+        Atom types
+    r_tol : float, optional
+        Distance tolerance for neighbor identification (default: 0.614)
+    s_neighbor_distance : float, optional
+        Distance threshold for S-type neighbors (default: 3.0)
+    
+    Returns
+    -------
+    numpy.ndarray
+        Stacking code (0-6) of each target atom, as int8
+    
+    Raises
+    ------
+    ImportError
+        If SciPy is not installed
+    """
+    if cKDTree is None:
+        raise ImportError("classify_patch_kdtree requires SciPy "
+                          "(pip install scipy)")
+    
+    tree = cKDTree(np.column_stack((xs, ys)))
+    target_xy = np.column_stack((xs[targets_idx], ys[targets_idx]))
+    neighbor_lists = tree.query_ball_point(target_xy,
+                                           r=s_neighbor_distance + r_tol)
+    
+    # Flatten the per-target lists into CSR form for the jitted kernel
+    lengths = np.array([len(rows) for rows in neighbor_lists], dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    candidates = np.fromiter(
+        (j for rows in neighbor_lists for j in rows),
+        dtype=np.int64, count=offsets[-1]
+    )
+    
+    return _classify_candidates(targets_idx, offsets, candidates, xs, ys,
+                                types, r_tol, s_neighbor_distance)
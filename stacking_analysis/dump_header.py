@@ -0,0 +1,226 @@
+"""
+Header parsing for LAMMPS dump files.
+
+These functions only read the 9 header lines and depend on the standard
+library alone, so that checking a file does not load the numerical stack.
+They are re-exported by :mod:`stacking_analysis.io_utils`.
+"""
+
+import functools
+import os
+import re
+
+
+# Number of header lines in a single-frame LAMMPS dump
+_HEADER_LINES = 9
+
+# Bytes read at a time when reading the header
+_HEADER_READ_SIZE = 4096
+
+# Number of parsed headers kept by _read_header
+_HEADER_CACHE_SIZE = 8
+
+# Separator of the column names in "ITEM: ATOMS" lines with unusual spacing
+_ATOMS_RE = re.compile(r'ITEM:\s*ATOMS\s+')
+
+
+def _parse_atoms_line(line):
+    """Column names from an "ITEM: ATOMS ..." line, or None."""
+    # Standard prefixes: plain string search, no regex needed
+    for prefix in ('ITEM: ATOMS ', 'ITEM:ATOMS '):
+        idx = line.find(prefix)
+        if idx >= 0:
+            return line[idx + len(prefix):].split()
+    
+    # Extract everything after "ITEM: ATOMS" with any other spacing
+    if 'ITEM: ATOMS' in line or 'ITEM:ATOMS' in line:
+        # Split and get everything after ATOMS
+        parts = _ATOMS_RE.split(line)
+        if len(parts) > 1:
+            return parts[1].strip().split()
+        else:
+            # Fallback: split by whitespace and skip first parts
+            parts = line.strip().split()
+            # Find index of 'ATOMS' and return everything after
+            if 'ATOMS' in parts:
+                idx = parts.index('ATOMS')
+                return parts[idx+1:]
+    
+    return None
+
+
+def _read_header_lines(filepath):
+    """
+    First 9 lines of a file, without line endings, from one bulk read.
+    
+    The header is read in 4 KiB chunks (a single one for any regular dump)
+    and split once, instead of reading it line by line.
+    """
+    with open(filepath, 'rb') as f:
+        head = f.read(_HEADER_READ_SIZE)
+        while head.count(b'\n') < _HEADER_LINES:
+            chunk = f.read(_HEADER_READ_SIZE)
+            if not chunk:
+                break
+            head += chunk
+    
+    lines = head.decode('ascii', errors='replace').split('\n', _HEADER_LINES)
+    if len(lines) > _HEADER_LINES:
+        # The rest of the file after the header
+        del lines[_HEADER_LINES:]
+    elif lines[-1] == '':
+        # Nothing after the last newline of a short file
+        lines.pop()
+    return lines
+
+
+@functools.lru_cache(maxsize=_HEADER_CACHE_SIZE)
+def _parse_header(filepath, mtime_ns, size):
+    """Parsed header of ``filepath``, cached per modification time and size."""
+    lines = _read_header_lines(filepath)
+    columns = None
+    if len(lines) == _HEADER_LINES:
+        columns = _parse_atoms_line(lines[8])
+    return {'lines': lines, 'columns': columns}
+
+
+def _read_header(filepath):
+    """
+    Read the header of a LAMMPS dump file in a single pass.
+    
+    Only the first 9 lines are read. The last few headers are cached per
+    path, modification time and size, so validation, metadata and loading
+    of the same file share one read while a rewritten file is read again.
+    
+    Returns
+    -------
+    dict
+        ``lines``: list of the header lines read (fewer than 9 if the file
+        is shorter), and ``columns``: column names parsed from line 9, or
+        None
+    """
+    stat = os.stat(filepath)
+    return _parse_header(filepath, stat.st_mtime_ns, stat.st_size)
+
+
+def parse_lammps_dump_columns(filepath):
+    """
+    Parse column names from LAMMPS dump file header (line 9).
+    
+    Parameters
+    ----------
+    filepath : str
+        Path to LAMMPS dump file
+    
+    Returns
+    -------
+    list
+        List of column names extracted from the ITEM: ATOMS line, or None
+        if they could not be parsed
+    
+    Examples
+    --------
+    For a line like "ITEM: ATOMS id type x y z fx fy fz"
+    Returns: ['id', 'type', 'x', 'y', 'z', 'fx', 'fy', 'fz']
+    """
+    columns = _read_header(filepath)['columns']
+    
+    # Callers may modify the list, the cached one must stay intact
+    return None if columns is None else list(columns)
+
+
+def read_lammps_dump_metadata(filepath):
+    """
+    Read metadata from LAMMPS dump file header.
+    
+    Parameters
+    ----------
+    filepath : str
+        Path to LAMMPS dump file
+    
+    Returns
+    -------
+    dict
+        Dictionary containing metadata:
+        - timestep: int
+        - n_atoms: int
+        - box_bounds: list of tuples [(xlo, xhi), (ylo, yhi), (zlo, zhi)]
+        - columns: list of column names
+    """
+    metadata = {}
+    
+    # Only the 9 header lines are needed, not the whole atom table
+    header = _read_header(filepath)
+    lines = header['lines']
+    
+    # Parse timestep (line 2)
+    if len(lines) > 1:
+        metadata['timestep'] = int(lines[1].strip())
+    
+    # Parse number of atoms (line 4)
+    if len(lines) > 3:
+        metadata['n_atoms'] = int(lines[3].strip())
+    
+    # Parse box bounds (lines 6-8)
+    if len(lines) > 7:
+        bounds = []
+        for i in range(5, 8):
+            parts = lines[i].strip().split()
+            bounds.append((float(parts[0]), float(parts[1])))
+        metadata['box_bounds'] = bounds
+    
+    # Parse column names (line 9)
+    metadata['columns'] = parse_lammps_dump_columns(filepath)
+    
+    return metadata
+
+
+def validate_lammps_dump(filepath):
+    """
+    Validate that a file is a proper single-frame LAMMPS dump file.
+    
+    Parameters
+    ----------
+    filepath : str
+        Path to file to validate
+    
+    Returns
+    -------
+    tuple
+        (is_valid: bool, message: str)
+    """
+    try:
+        header = _read_header(filepath)
+        # Missing lines of a truncated file read as empty
+        lines = header['lines'] + [''] * (_HEADER_LINES - len(header['lines']))
+        
+        # Check for LAMMPS dump format markers
+        if 'ITEM: TIMESTEP' not in lines[0]:
+            return False, "Line 1 should contain 'ITEM: TIMESTEP'"
+        
+        if 'ITEM: NUMBER OF ATOMS' not in lines[2]:
+            return False, "Line 3 should contain 'ITEM: NUMBER OF ATOMS'"
+        
+        if 'ITEM: BOX BOUNDS' not in lines[4]:
+            return False, "Line 5 should contain 'ITEM: BOX BOUNDS'"
+        
+        if 'ITEM: ATOMS' not in lines[8]:
+            return False, "Line 9 should contain 'ITEM: ATOMS'"
+        
+        # Try to parse columns
+        columns = header['columns']
+        if columns is None:
+            return False, "Could not parse column names from line 9"
+        
+        if len(columns) < 5:
+            return False, f"Need at least 5 columns (id, type, x, y, z), found {len(columns)}"
+        
+        required = ['id', 'type', 'x', 'y', 'z']
+        for i, req in enumerate(required):
+            if i >= len(columns) or columns[i] != req:
+                return False, f"Column {i+1} should be '{req}', found '{columns[i] if i < len(columns) else 'missing'}'"
+        
+        return True, "Valid LAMMPS dump file"
+        
+    except Exception as e:
+        return False, f"Error reading file: {str(e)}"
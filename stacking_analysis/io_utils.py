@@ -5,60 +5,92 @@ This module handles reading LAMMPS dump files and writing output files
 in various formats.
 """
 
+import mmap
+import os
+import numpy as np
 import pandas as pd
-import re
 
+# Header functions are part of this module's interface
+from .dump_header import (parse_lammps_dump_columns, read_lammps_dump_metadata,
+                          validate_lammps_dump)
 
-def parse_lammps_dump_columns(filepath):
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # PyArrow is optional, read_csv is used without it
+    pa = pacsv = None
+
+try:
+    from ._fast_parse import read_atom_block
+except ImportError:  # Numba is not needed just to read files
+    read_atom_block = None
+
+
+# Columns needed by the analysis, read by default
+ANALYSIS_COLUMNS = ('id', 'type', 'x', 'y', 'z')
+
+# Storage types of the analysis columns. Dump coordinates carry at most 6-8
+# significant digits, so float32 loses nothing and halves their footprint;
+# other columns keep the parser's default types
+_COLUMN_DTYPES = {'id': 'int64', 'type': 'int8',
+                  'x': 'float32', 'y': 'float32', 'z': 'float32'}
+
+# Types the parsers read the columns as. ``type`` is parsed wide and range
+# checked by as_atom_types, as a direct int8 parse wraps out-of-range values
+_PARSE_DTYPES = dict(_COLUMN_DTYPES, type='int64')
+
+# PyArrow CSV block size: each block is tokenized by its own thread
+_ARROW_BLOCK_SIZE = 16 << 20
+
+# Initial number of bytes searched for the end of the header
+_HEADER_SCAN_SIZE = 1 << 16
+
+
+def as_atom_types(values):
     """
-    Parse column names from LAMMPS dump file header (line 9).
-    
-    Parameters
-    ----------
-    filepath : str
-        Path to LAMMPS dump file
-    
-    Returns
-    -------
-    list
-        List of column names extracted from the ITEM: ATOMS line
+    Atom types as an int8 array.
     
-    Examples
-    --------
-    For a line like "ITEM: ATOMS id type x y z fx fy fz"
-    Returns: ['id', 'type', 'x', 'y', 'z', 'fx', 'fy', 'fz']
+    Raises
+    ------
+    ValueError
+        If a type does not fit in int8 (-128 to 127)
     """
-    with open(filepath, 'r') as f:
-        for i, line in enumerate(f):
-            if i == 8:  # Line 9 (0-indexed as line 8)
-                # Extract everything after "ITEM: ATOMS"
-                if 'ITEM: ATOMS' in line or 'ITEM:ATOMS' in line:
-                    # Split and get everything after ATOMS
-                    parts = re.split(r'ITEM:\s*ATOMS\s+', line)
-                    if len(parts) > 1:
-                        columns = parts[1].strip().split()
-                        return columns
-                    else:
-                        # Fallback: split by whitespace and skip first parts
-                        parts = line.strip().split()
-                        # Find index of 'ATOMS' and return everything after
-                        if 'ATOMS' in parts:
-                            idx = parts.index('ATOMS')
-                            return parts[idx+1:]
-                break
-    
-    # If we couldn't parse, return None
-    return None
-
-
-def read_structure_file(filepath, skiprows=9, columns=None):
+    values = np.asarray(values)
+    if len(values) and values.dtype != np.int8:
+        low, high = values.min(), values.max()
+        if low < -128 or high > 127:
+            bad = low if low < -128 else high
+            raise ValueError(f"Atom type {bad} is out of range: types must be "
+                             "between -128 and 127")
+    return values.astype(np.int8, copy=False)
+
+
+def _detect_columns(filepath, columns):
+    """Column names given by the caller, else parsed from the header."""
+    # Try to auto-detect columns from file
+    if columns is None:
+        columns = parse_lammps_dump_columns(filepath)
+        
+        if columns is None:
+            # Fallback to default columns
+            print("Warning: Could not auto-detect columns from LAMMPS dump file.")
+            print("Using default columns: ['id', 'type', 'x', 'y', 'z', 'fx', 'fy', 'fz', 'c_myPE']")
+            columns = ["id", "type", "x", "y", "z", "fx", "fy", "fz", "c_myPE"]
+        else:
+            print(f"Auto-detected columns: {columns}")
+    
+    return columns
+
+
+def read_structure_file(filepath, skiprows=9, columns=None,
+                        usecols=ANALYSIS_COLUMNS):
     """
     Read LAMMPS dump file (single frame).
     
     This function automatically reads column names from the LAMMPS dump file
     header (line 9: "ITEM: ATOMS ..."). It requires the first 5 columns to be
-    id, type, x, y, z (in that order). Additional columns are read but not
-    required for analysis.
+    id, type, x, y, z (in that order). By default only these columns are
+    parsed; additional columns are read only when listed in ``usecols``.
     
     Parameters
     ----------
@@ -69,11 +101,15 @@ def read_structure_file(filepath, skiprows=9, columns=None):
     columns : list, optional
         Column names. If None, automatically parses from line 9 of dump file.
         If parsing fails, uses default columns.
+    usecols : list, optional
+        Columns to read (default: id, type, x, y, z). Pass a superset to keep
+        additional columns in the output, or None to read every column.
     
     Returns
     -------
     pandas.DataFrame
-        DataFrame containing atomic structure data
+        DataFrame containing atomic structure data, with ``id`` as int64,
+        ``type`` as int8 and the coordinates as float32
     
     Raises
     ------
@@ -95,7 +131,13 @@ def read_structure_file(filepath, skiprows=9, columns=None):
     Line 10+: <atom data>
     
     Required columns (first 5): id, type, x, y, z
-    Additional columns are optional and will be preserved.
+    Additional columns are optional and are preserved when selected with
+    ``usecols``.
+    
+    When only the analysis columns are read, the atom block is parsed by a
+    compiled Numba parser. Otherwise, when PyArrow is installed,
+    single-space delimited files are parsed with its multithreaded CSV
+    reader; in all other cases the pandas C parser is used.
     
     Examples
     --------
@@ -105,94 +147,244 @@ def read_structure_file(filepath, skiprows=9, columns=None):
     # With custom columns (if auto-detection fails)
     >>> df = read_structure_file('dump.lammpstrj', 
     ...                          columns=['id', 'type', 'x', 'y', 'z', 'fx', 'fy', 'fz'])
+    
+    # Keep the forces as well
+    >>> df = read_structure_file('dump.lammpstrj',
+    ...                          usecols=['id', 'type', 'x', 'y', 'z', 'fx', 'fy', 'fz'])
     """
     
-    # Try to auto-detect columns from file
-    if columns is None:
-        columns = parse_lammps_dump_columns(filepath)
-        
-        if columns is None:
-            # Fallback to default columns
-            print("Warning: Could not auto-detect columns from LAMMPS dump file.")
-            print("Using default columns: ['id', 'type', 'x', 'y', 'z', 'fx', 'fy', 'fz', 'c_myPE']")
-            columns = ["id", "type", "x", "y", "z", "fx", "fy", "fz", "c_myPE"]
-        else:
-            print(f"Auto-detected columns: {columns}")
+    columns = _detect_columns(filepath, columns)
     
     try:
-        df = pd.read_csv(filepath, sep=r'\s+', skiprows=skiprows, names=columns, 
-                        engine='python')
+        df = _read_atoms_fast(filepath, skiprows, columns, usecols)
+        if df is None:
+            df = _read_atoms_arrow(filepath, skiprows, columns, usecols)
+        if df is None:
+            df = _read_atoms_pandas(filepath, skiprows, columns, usecols)
     except FileNotFoundError:
         raise FileNotFoundError(f"Input file not found: {filepath}")
     except Exception as e:
         raise ValueError(f"Error reading file {filepath}: {str(e)}")
     
     # Validate required columns (first 5 must be id, type, x, y, z)
-    required_cols = ['id', 'type', 'x', 'y', 'z']
-    
     if len(df.columns) < 5:
         raise ValueError(f"File must have at least 5 columns (id, type, x, y, z). Found: {df.columns.tolist()}")
     
     # Check that first 5 columns are the required ones
-    first_five = df.columns[:5].tolist()
-    for i, (expected, actual) in enumerate(zip(required_cols, first_five)):
-        if expected != actual:
-            raise ValueError(
-                f"Column {i+1} must be '{expected}', but found '{actual}'. "
-                f"Required column order: id, type, x, y, z [optional columns...]"
-            )
+    first_five = tuple(df.columns[:5])
+    if first_five != ANALYSIS_COLUMNS:
+        # Report the first mismatching column
+        i, expected, actual = next(
+            (i, expected, actual)
+            for i, (expected, actual) in enumerate(zip(ANALYSIS_COLUMNS, first_five))
+            if expected != actual
+        )
+        raise ValueError(
+            f"Column {i+1} must be '{expected}', but found '{actual}'. "
+            f"Required column order: id, type, x, y, z [optional columns...]"
+        )
     
     # Issue warning if we have fewer than expected columns but requirements are met
-    if len(df.columns) < len(columns):
-        print(f"Warning: Expected {len(columns)} columns but found {len(df.columns)}. "
+    expected = len(columns) if usecols is None else len(usecols)
+    if len(df.columns) < expected:
+        print(f"Warning: Expected {expected} columns but found {len(df.columns)}. "
               "This may indicate a parsing issue.")
     
     return df
 
 
-def read_lammps_dump_metadata(filepath):
+def read_structure_arrays(filepath, skiprows=9, columns=None):
     """
-    Read metadata from LAMMPS dump file header.
+    Read the ids, types and coordinates of a LAMMPS dump file as arrays.
+    
+    Unlike :func:`read_structure_file`, no DataFrame is built: the columns
+    come straight from the compiled parser when it can read the file.
     
     Parameters
     ----------
     filepath : str
-        Path to LAMMPS dump file
+        Path to the input LAMMPS dump file (single frame)
+    skiprows : int, optional
+        Number of header rows to skip (default: 9 for LAMMPS dump format)
+    columns : list, optional
+        Column names. If None, automatically parses from line 9 of dump file.
     
     Returns
     -------
     dict
-        Dictionary containing metadata:
-        - timestep: int
-        - n_atoms: int
-        - box_bounds: list of tuples [(xlo, xhi), (ylo, yhi), (zlo, zhi)]
-        - columns: list of column names
+        ``id`` (int64), ``type`` (int8) and ``xyz``, a C-contiguous
+        (n_atoms, 3) float32 array of the x, y, z coordinates
+    
+    Raises
+    ------
+    FileNotFoundError
+        If the input file does not exist
+    ValueError
+        If the file format is invalid or required columns are missing
+    
+    Examples
+    --------
+    >>> atoms = read_structure_arrays('dump.lammpstrj')
+    >>> tree = cKDTree(atoms['xyz'])
     """
-    metadata = {}
+    columns = _detect_columns(filepath, columns)
     
-    with open(filepath, 'r') as f:
-        lines = f.readlines()
+    try:
+        arrays = _read_atom_arrays(filepath, skiprows, columns)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Input file not found: {filepath}")
+    except Exception as e:
+        raise ValueError(f"Error reading file {filepath}: {str(e)}")
     
-    # Parse timestep (line 2)
-    if len(lines) > 1:
-        metadata['timestep'] = int(lines[1].strip())
+    if arrays is None:
+        # General parsers, with the column checks of read_structure_file
+        df = read_structure_file(filepath, skiprows, columns,
+                                 usecols=ANALYSIS_COLUMNS)
+        arrays = {
+            'id': df['id'].to_numpy(np.int64),
+            'type': as_atom_types(df['type'].to_numpy()),
+            'xyz': np.ascontiguousarray(df[['x', 'y', 'z']].to_numpy(np.float32)),
+        }
+    
+    return arrays
+
+
+def _body_offset(data, skiprows):
+    """
+    Byte offset of the line following the first ``skiprows`` lines.
     
-    # Parse number of atoms (line 4)
-    if len(lines) > 3:
-        metadata['n_atoms'] = int(lines[3].strip())
+    Newlines are located with a vectorized search over the start of the
+    uint8 buffer ``data``, widened until enough are found. Returns None if
+    the file has fewer lines.
+    """
+    if skiprows == 0:
+        return 0
+    size = _HEADER_SCAN_SIZE
+    while True:
+        newlines = np.flatnonzero(data[:size] == ord('\n'))
+        if len(newlines) >= skiprows:
+            return int(newlines[skiprows - 1]) + 1
+        if size >= len(data):
+            return None
+        size *= 4
+
+
+def _read_atom_arrays(filepath, skiprows, columns):
+    """
+    Parse the analysis columns with the compiled parser of ``_fast_parse``.
+    
+    Returns the arrays of :func:`read_atom_block`, or None when Numba is not
+    available, when the first columns are not id, type, x, y, z, or when
+    the file has lines the parser does not handle; the caller then falls
+    back to the general parsers.
+    """
+    if read_atom_block is None or tuple(columns[:5]) != ANALYSIS_COLUMNS:
+        return None
+    
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = np.frombuffer(mm, dtype=np.uint8)
+            try:
+                start = _body_offset(data, skiprows)
+                arrays = None if start is None else read_atom_block(data[start:])
+            finally:
+                # The views must be released before the map is closed
+                del data
+    
+    return arrays
+
+
+def _read_atoms_fast(filepath, skiprows, columns, usecols):
+    """
+    DataFrame of the analysis columns from :func:`_read_atom_arrays`.
     
-    # Parse box bounds (lines 6-8)
-    if len(lines) > 7:
-        bounds = []
-        for i in range(5, 8):
-            parts = lines[i].strip().split()
-            bounds.append((float(parts[0]), float(parts[1])))
-        metadata['box_bounds'] = bounds
+    Returns None when other columns are requested or the compiled parser
+    cannot read the file.
+    """
+    if usecols is None or set(usecols) != set(ANALYSIS_COLUMNS):
+        return None
     
-    # Parse column names (line 9)
-    metadata['columns'] = parse_lammps_dump_columns(filepath)
+    arrays = _read_atom_arrays(filepath, skiprows, columns)
+    if arrays is None:
+        return None
     
-    return metadata
+    xyz = arrays['xyz']
+    return pd.DataFrame({'id': arrays['id'], 'type': arrays['type'],
+                         'x': xyz[:, 0], 'y': xyz[:, 1], 'z': xyz[:, 2]})
+
+
+def _read_atoms_arrow(filepath, skiprows, columns, usecols):
+    """
+    Parse the atom table with the multithreaded PyArrow CSV reader.
+    
+    Returns None when PyArrow is not installed or the file is not strictly
+    single-space delimited (e.g. aligned or trailing whitespace), in which
+    case the caller falls back to :func:`_read_atoms_pandas`.
+    """
+    if pacsv is None:
+        return None
+    
+    # Keep the file order of the columns, as read_csv does
+    if usecols is None:
+        include = []
+    else:
+        include = [col for col in columns if col in usecols]
+        if len(include) != len(set(usecols)):
+            return None
+    
+    try:
+        # The blocks are zero-copy slices of the memory-mapped file, read
+        # from the first atom line on
+        with pa.memory_map(filepath) as source:
+            data = source.read_buffer()
+            start = _body_offset(np.frombuffer(data, dtype=np.uint8), skiprows)
+            if start is None:
+                return None
+            table = pacsv.read_csv(
+                pa.BufferReader(data.slice(start)),
+                read_options=pacsv.ReadOptions(column_names=columns,
+                                               use_threads=True,
+                                               block_size=_ARROW_BLOCK_SIZE),
+                parse_options=pacsv.ParseOptions(delimiter=' '),
+                convert_options=pacsv.ConvertOptions(
+                    include_columns=include,
+                    column_types={col: pa.from_numpy_dtype(dtype)
+                                  for col, dtype in _PARSE_DTYPES.items()
+                                  if col in columns},
+                ),
+            )
+    except pa.ArrowInvalid:
+        return None
+    
+    return _downcast_types(table.to_pandas())
+
+
+def _read_atoms_pandas(filepath, skiprows, columns, usecols):
+    """Parse the atom table with the pandas C parser."""
+    # sep=r'\s+' is handled natively by the C tokenizer (the equivalent of
+    # the deprecated delim_whitespace=True), so no Python-engine fallback is
+    # needed. Dumps carry no NA markers, so NA detection is skipped.
+    df = pd.read_csv(filepath, sep=r'\s+', skiprows=skiprows, names=columns,
+                     usecols=usecols, header=None, engine='c',
+                     dtype=_PARSE_DTYPES, na_filter=False,
+                     memory_map=True, low_memory=False)
+    return _downcast_types(df)
+
+
+def _downcast_types(df):
+    """Store the ``type`` column of a parsed table as int8, if present."""
+    if 'type' in df.columns:
+        df['type'] = as_atom_types(df['type'].to_numpy())
+    return df
+
+
+# Write buffer size for output files (1 MiB)
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# Output formats of write_results
+OUTPUT_FORMATS = ('xyz', 'csv', 'parquet', 'npy')
 
 
 def write_xyz(filepath, atom_data):
@@ -212,11 +404,10 @@ def write_xyz(filepath, atom_data):
     - First line: number of atoms
     - Remaining lines: atom data in space-separated format
     """
-    with open(filepath, 'w') as file:
-        # Write number of atoms
+    # Count line and atom data go through one buffered handle
+    with open(filepath, 'w', buffering=_WRITE_BUFFER_SIZE) as file:
         file.write(f"{len(atom_data)}\n")
-        # Write atom data
-        atom_data.to_csv(file, sep=' ', index=False, header=True, mode='a')
+        atom_data.to_csv(file, sep=' ', index=False, header=True)
 
 
 def write_results_csv(filepath, results_df):
@@ -229,55 +420,157 @@ def write_results_csv(filepath, results_df):
         Path to output CSV file
     results_df : pandas.DataFrame
         DataFrame containing analysis results
+    
+    Notes
+    -----
+    When PyArrow is installed, integer and categorical columns (such as
+    ``id``, ``S_TYPE`` and ``S_CODE``) are written with its CSV writer,
+    producing the same text as ``DataFrame.to_csv``. Other frames are
+    written with ``to_csv``.
     """
+    table = _arrow_results_table(results_df)
+    if table is not None:
+        try:
+            # The header is written as to_csv does, without quotes
+            with open(filepath, 'wb', buffering=_WRITE_BUFFER_SIZE) as file:
+                file.write((','.join(map(str, results_df.columns)) + '\n')
+                           .encode())
+                pacsv.write_csv(table, file, write_options=pacsv.WriteOptions(
+                    include_header=False, quoting_style='none'))
+            return
+        except pa.ArrowInvalid:
+            # A value needs quoting, which to_csv handles
+            pass
+    
     results_df.to_csv(filepath, index=False)
 
 
-def validate_lammps_dump(filepath):
+def _arrow_results_table(results_df):
     """
-    Validate that a file is a proper single-frame LAMMPS dump file.
+    Arrow table of ``results_df`` if PyArrow writes it as to_csv would.
+    
+    Floats, booleans and other types are formatted differently by the two
+    writers (e.g. ``8`` instead of ``8.0``), so only integer columns and
+    categorical columns of strings are accepted; returns None otherwise.
+    """
+    if pacsv is None:
+        return None
+    
+    for dtype in results_df.dtypes:
+        if isinstance(dtype, pd.CategoricalDtype):
+            if not pd.api.types.is_string_dtype(dtype.categories):
+                return None
+        elif not pd.api.types.is_integer_dtype(dtype):
+            return None
+    
+    try:
+        return pa.Table.from_pandas(results_df, preserve_index=False)
+    except pa.ArrowException:
+        return None
+
+
+def write_results_parquet(filepath, results_df):
+    """
+    Write analysis results to a Parquet file.
     
     Parameters
     ----------
     filepath : str
-        Path to file to validate
+        Path to output Parquet file
+    results_df : pandas.DataFrame
+        DataFrame containing analysis results
     
-    Returns
-    -------
-    tuple
-        (is_valid: bool, message: str)
+    Raises
+    ------
+    ImportError
+        If PyArrow is not installed
+    
+    Notes
+    -----
+    Columns keep their types: ``S_TYPE`` is stored dictionary encoded and
+    missing ``S_CODE`` values stay null. The file is compressed with zstd.
     """
-    try:
-        with open(filepath, 'r') as f:
-            lines = [f.readline() for _ in range(10)]
-        
-        # Check for LAMMPS dump format markers
-        if 'ITEM: TIMESTEP' not in lines[0]:
-            return False, "Line 1 should contain 'ITEM: TIMESTEP'"
-        
-        if 'ITEM: NUMBER OF ATOMS' not in lines[2]:
-            return False, "Line 3 should contain 'ITEM: NUMBER OF ATOMS'"
-        
-        if 'ITEM: BOX BOUNDS' not in lines[4]:
-            return False, "Line 5 should contain 'ITEM: BOX BOUNDS'"
-        
-        if 'ITEM: ATOMS' not in lines[8]:
-            return False, "Line 9 should contain 'ITEM: ATOMS'"
-        
-        # Try to parse columns
-        columns = parse_lammps_dump_columns(filepath)
-        if columns is None:
-            return False, "Could not parse column names from line 9"
-        
-        if len(columns) < 5:
-            return False, f"Need at least 5 columns (id, type, x, y, z), found {len(columns)}"
-        
-        required = ['id', 'type', 'x', 'y', 'z']
-        for i, req in enumerate(required):
-            if i >= len(columns) or columns[i] != req:
-                return False, f"Column {i+1} should be '{req}', found '{columns[i] if i < len(columns) else 'missing'}'"
-        
-        return True, "Valid LAMMPS dump file"
-        
-    except Exception as e:
-        return False, f"Error reading file: {str(e)}"
+    if pa is None:
+        raise ImportError("Parquet output requires PyArrow "
+                          "(pip install pyarrow)")
+    
+    results_df.to_parquet(filepath, engine='pyarrow', compression='zstd',
+                          index=False)
+
+
+def write_results_npy(filepath, results_df):
+    """
+    Write analysis results to a NumPy ``.npy`` file as a structured array.
+    
+    Parameters
+    ----------
+    filepath : str
+        Path to output file
+    results_df : pandas.DataFrame
+        DataFrame containing analysis results
+    
+    Notes
+    -----
+    Each column becomes a field of the structured array, so the file loads
+    with ``np.load(filepath)`` (no pickling). Categorical columns such as
+    ``S_TYPE`` are stored as fixed-width strings, with missing labels as
+    ''; missing values of nullable integer columns such as ``S_CODE`` are
+    stored as -1.
+    """
+    fields = {}
+    for name, column in results_df.items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.astype(object).where(column.notna(), '')
+            fields[name] = values.to_numpy(dtype=str)
+        elif isinstance(column.dtype, pd.api.extensions.ExtensionDtype):
+            fields[name] = column.to_numpy(dtype=column.dtype.numpy_dtype,
+                                           na_value=-1)
+        else:
+            fields[name] = column.to_numpy()
+    
+    records = np.empty(len(results_df), dtype=[(str(name), values.dtype)
+                                               for name, values in fields.items()])
+    for name, values in fields.items():
+        records[str(name)] = values
+    
+    # Through a file object, np.save keeps the path as given
+    with open(filepath, 'wb') as file:
+        np.save(file, records)
+
+
+def write_results(filepath, results_df, output_format=None):
+    """
+    Write analysis results in one of the supported output formats.
+    
+    Parameters
+    ----------
+    filepath : str
+        Path to output file
+    results_df : pandas.DataFrame
+        DataFrame containing analysis results
+    output_format : str, optional
+        One of 'xyz' (see :func:`write_xyz`), 'csv', 'parquet' or 'npy'. If
+        None, it is inferred from the suffix of ``filepath``: ``.csv``,
+        ``.parquet`` and ``.npy`` select those formats, anything else
+        (e.g. ``.stack``) writes xyz.
+    
+    Raises
+    ------
+    ValueError
+        If ``output_format`` is not supported
+    """
+    if output_format is None:
+        suffix = os.path.splitext(filepath)[1].lower().lstrip('.')
+        output_format = suffix if suffix in OUTPUT_FORMATS else 'xyz'
+    
+    writers = {
+        'xyz': write_xyz,
+        'csv': write_results_csv,
+        'parquet': write_results_parquet,
+        'npy': write_results_npy,
+    }
+    if output_format not in writers:
+        raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}, "
+                         f"got '{output_format}'")
+    
+    writers[output_format](filepath, results_df)
@@ -7,9 +7,144 @@ for analyzing bilayer stacking configurations from LAMMPS dump files.
 """
 
 import argparse
+import concurrent.futures
 import sys
-from stacking_analysis import StackingAnalyzer
-from stacking_analysis.io_utils import validate_lammps_dump, read_lammps_dump_metadata
+# Header checks only need the standard library; the analysis modules
+# (Numba, pandas) are imported once an analysis is actually run
+from stacking_analysis.dump_header import (validate_lammps_dump,
+                                           read_lammps_dump_metadata)
+
+
+def _show_metadata(input_path):
+    """Print the header metadata of a dump file; returns the exit code."""
+    try:
+        metadata = read_lammps_dump_metadata(input_path)
+        print(f"LAMMPS Dump File Metadata")
+        print(f"=" * 50)
+        print(f"File: {input_path}")
+        print(f"Timestep: {metadata.get('timestep', 'N/A')}")
+        print(f"Number of atoms: {metadata.get('n_atoms', 'N/A')}")
+        if 'box_bounds' in metadata:
+            bounds = metadata['box_bounds']
+            print(f"Box bounds:")
+            print(f"  x: {bounds[0][0]:.3f} to {bounds[0][1]:.3f}")
+            print(f"  y: {bounds[1][0]:.3f} to {bounds[1][1]:.3f}")
+            print(f"  z: {bounds[2][0]:.3f} to {bounds[2][1]:.3f}")
+        if 'columns' in metadata:
+            print(f"Columns: {metadata['columns']}")
+        return 0
+    except Exception as e:
+        print(f"Error reading metadata: {e}", file=sys.stderr)
+        return 1
+
+
+def _run_analysis(input_path, output_path, args, n_processes, verbose):
+    """
+    Analyze one dump file and write its results.
+    
+    Returns
+    -------
+    dict
+        Statistics from StackingAnalyzer.get_statistics()
+    """
+    from stacking_analysis import StackingAnalyzer
+    from stacking_analysis.io_utils import ANALYSIS_COLUMNS
+    
+    analyzer = StackingAnalyzer(
+        r_tol=args.r_tol,
+        voxel_size=args.voxel_size,
+        s_neighbor_distance=args.s_distance,
+        n_processes=n_processes,
+        neighbor_search=args.neighbor_search,
+        verbose=verbose
+    )
+    
+    if args.usecols is None:
+        usecols = ANALYSIS_COLUMNS
+    elif args.usecols == ['all']:
+        usecols = None
+    else:
+        usecols = args.usecols
+    
+    analyzer.load_structure(input_path, skiprows=args.skiprows,
+                            usecols=usecols)
+    analyzer.analyze()
+    analyzer.save_results(output_path, atom_type=args.atom_type,
+                          output_format=args.output_format)
+    
+    return analyzer.get_statistics()
+
+
+def _default_output(input_path, output_format):
+    """Default output path: INPUT.stack, plus the suffix of binary formats."""
+    if output_format in (None, 'xyz'):
+        return f"{input_path}.stack"
+    return f"{input_path}.stack.{output_format}"
+
+
+def _init_batch_worker(n_workers):
+    """Split the Numba threads evenly between the batch worker processes."""
+    import numba
+    numba.set_num_threads(max(1, numba.config.NUMBA_NUM_THREADS // n_workers))
+
+
+def _analyze_batch_file(job):
+    """
+    Batch task: analyze one file in a worker process.
+    
+    Errors are returned rather than raised, so that one bad file does not
+    stop the rest of the batch.
+    """
+    input_path, output_path, args = job
+    try:
+        stats = _run_analysis(input_path, output_path, args,
+                              n_processes=1, verbose=False)
+        return stats, None
+    except Exception as e:
+        return None, str(e)
+
+
+def _run_batch(inputs, args):
+    """
+    Analyze several dump files, one file per worker process.
+    
+    With --processes N, up to N files are analyzed at once, each by a
+    single-process StackingAnalyzer so that pools are not nested.
+    Without it the files are analyzed one after the other.
+    
+    Returns
+    -------
+    int
+        Exit code: 0 if every file was analyzed, 1 otherwise
+    """
+    jobs = [(path, _default_output(path, args.output_format), args)
+            for path in inputs]
+    n_workers = min(args.processes or 1, len(jobs))
+    
+    if n_workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_init_batch_worker,
+            initargs=(n_workers,)
+        )
+        with executor:
+            results = list(executor.map(_analyze_batch_file, jobs))
+    else:
+        results = [_analyze_batch_file(job) for job in jobs]
+    
+    n_failed = 0
+    for (input_path, output_path, _), (stats, error) in zip(jobs, results):
+        if error is not None:
+            n_failed += 1
+            print(f"Error: {input_path}: {error}", file=sys.stderr)
+        elif not args.quiet:
+            print(f"{input_path}: {stats['total_atoms']} atoms analyzed, "
+                  f"output written to {output_path}")
+    
+    if not args.quiet:
+        print(f"\nAnalyzed {len(jobs) - n_failed} of {len(jobs)} files")
+    
+    return 1 if n_failed else 0
 
 
 def main():
@@ -23,13 +158,16 @@ Examples:
   %(prog)s dump.lammpstrj -o results.stack
   %(prog)s dump.lammpstrj --r-tol 0.7 --voxel-size 200
   %(prog)s dump.lammpstrj --processes 8 --quiet
+  %(prog)s frames/*.dump --processes 8
+  %(prog)s dump.lammpstrj --output-format parquet
 
 Input File Format:
   The input must be a single-frame LAMMPS dump file with at least these columns:
     id, type, x, y, z
   
   Additional columns (fx, fy, fz, energies, stresses, etc.) are automatically 
-  detected and preserved but not used in the analysis.
+  detected but not used in the analysis. They are skipped while reading
+  unless listed with --usecols (or kept with --usecols all).
   
   To extract a single frame from a multi-frame dump:
     tail -n $((N_atoms + 9)) dump.lammpstrj > single_frame.dump
@@ -50,13 +188,16 @@ For more information, visit: https://github.com/anikeya9/stacking-analysis
     # Required arguments
     parser.add_argument(
         'input',
-        help='Input LAMMPS dump file (single frame)'
+        nargs='+',
+        help='Input LAMMPS dump file(s) (single frame each)'
     )
     
     # Optional arguments
     parser.add_argument(
         '-o', '--output',
-        help='Output file path (default: INPUT.stack)',
+        help='Output file path (default: INPUT.stack, or INPUT.stack.FORMAT '
+             'with --output-format csv/parquet/npy; only valid with a single '
+             'input file)',
         default=None
     )
     
@@ -85,7 +226,17 @@ For more information, visit: https://github.com/anikeya9/stacking-analysis
         '--processes',
         type=int,
         default=None,
-        help='Number of parallel processes (default: all CPUs)'
+        help='Number of worker processes (default: 1; each process classifies '
+             'atoms with Numba threads on all available CPUs). With several '
+             'input files, up to this many files are analyzed at once'
+    )
+    
+    parser.add_argument(
+        '--neighbor-search',
+        choices=['grid', 'kdtree', 'brute'],
+        default='grid',
+        help='Neighbor search method within each patch (default: grid; '
+             'kdtree requires SciPy; brute is a tiled full scan)'
     )
     
     parser.add_argument(
@@ -95,6 +246,24 @@ For more information, visit: https://github.com/anikeya9/stacking-analysis
         help='Number of header rows to skip in input file (default: 9 for LAMMPS dump)'
     )
     
+    parser.add_argument(
+        '--usecols',
+        nargs='+',
+        metavar='COLUMN',
+        default=None,
+        help='Columns to read and write (default: id type x y z; '
+             '"all" keeps every column)'
+    )
+    
+    parser.add_argument(
+        '--output-format',
+        choices=['xyz', 'csv', 'parquet', 'npy'],
+        default=None,
+        help='Output file format (default: from the output suffix, .csv, '
+             '.parquet or .npy, else the xyz-style .stack format; parquet '
+             'requires PyArrow)'
+    )
+    
     parser.add_argument(
         '--atom-type',
         type=int,
@@ -127,71 +296,61 @@ For more information, visit: https://github.com/anikeya9/stacking-analysis
     )
     
     args = parser.parse_args()
+    inputs = args.input
     
-    # Validate input file if requested
+    if args.output is not None and len(inputs) > 1:
+        parser.error("-o/--output can only be used with a single input file")
+    
+    # Validate input files if requested
     if args.validate:
-        is_valid, message = validate_lammps_dump(args.input)
-        if is_valid:
-            print(f"✓ {message}")
-            print(f"  File: {args.input}")
-            return 0
-        else:
-            print(f"✗ Invalid LAMMPS dump file: {message}", file=sys.stderr)
-            print(f"  File: {args.input}", file=sys.stderr)
-            return 1
+        exit_code = 0
+        for input_path in inputs:
+            is_valid, message = validate_lammps_dump(input_path)
+            if is_valid:
+                print(f"✓ {message}")
+                print(f"  File: {input_path}")
+            else:
+                print(f"✗ Invalid LAMMPS dump file: {message}", file=sys.stderr)
+                print(f"  File: {input_path}", file=sys.stderr)
+                exit_code = 1
+        return exit_code
     
     # Show metadata if requested
     if args.show_metadata:
-        try:
-            metadata = read_lammps_dump_metadata(args.input)
-            print(f"LAMMPS Dump File Metadata")
-            print(f"=" * 50)
-            print(f"File: {args.input}")
-            print(f"Timestep: {metadata.get('timestep', 'N/A')}")
-            print(f"Number of atoms: {metadata.get('n_atoms', 'N/A')}")
-            if 'box_bounds' in metadata:
-                bounds = metadata['box_bounds']
-                print(f"Box bounds:")
-                print(f"  x: {bounds[0][0]:.3f} to {bounds[0][1]:.3f}")
-                print(f"  y: {bounds[1][0]:.3f} to {bounds[1][1]:.3f}")
-                print(f"  z: {bounds[2][0]:.3f} to {bounds[2][1]:.3f}")
-            if 'columns' in metadata:
-                print(f"Columns: {metadata['columns']}")
-            return 0
-        except Exception as e:
-            print(f"Error reading metadata: {e}", file=sys.stderr)
-            return 1
-    
-    # Set output path
-    if args.output is None:
-        args.output = f"{args.input}.stack"
+        exit_code = 0
+        for input_path in inputs:
+            if _show_metadata(input_path) != 0:
+                exit_code = 1
+        return exit_code
     
     # Quick validation before starting analysis
     if not args.quiet:
-        is_valid, message = validate_lammps_dump(args.input)
-        if not is_valid:
-            print(f"Warning: {message}", file=sys.stderr)
-            print("Attempting to proceed anyway...\n", file=sys.stderr)
+        for input_path in inputs:
+            is_valid, message = validate_lammps_dump(input_path)
+            if not is_valid:
+                prefix = f"{input_path}: " if len(inputs) > 1 else ""
+                print(f"Warning: {prefix}{message}", file=sys.stderr)
+                print("Attempting to proceed anyway...\n", file=sys.stderr)
+    
+    if len(inputs) > 1:
+        return _run_batch(inputs, args)
+    
+    input_path = inputs[0]
+    
+    # Set output path
+    if args.output is None:
+        args.output = _default_output(input_path, args.output_format)
     
     # Run analysis
     try:
-        analyzer = StackingAnalyzer(
-            r_tol=args.r_tol,
-            voxel_size=args.voxel_size,
-            s_neighbor_distance=args.s_distance,
-            n_processes=args.processes,
-            verbose=not args.quiet
-        )
-        
-        analyzer.load_structure(args.input, skiprows=args.skiprows)
-        analyzer.analyze()
-        analyzer.save_results(args.output, atom_type=args.atom_type)
+        stats = _run_analysis(input_path, args.output, args,
+                              n_processes=args.processes,
+                              verbose=not args.quiet)
         
         if not args.quiet:
             print("\n" + "="*50)
             print("ANALYSIS COMPLETE")
             print("="*50)
-            stats = analyzer.get_statistics()
             print(f"\nTotal atoms analyzed: {stats['total_atoms']}")
             print("\nStacking type distribution:")
             for s_type, count in sorted(stats['type_counts'].items()):
@@ -0,0 +1,81 @@
+"""
+Tests for reading LAMMPS dump files.
+
+The compiled parser, the pandas C parser and read_structure_file must agree
+on files with irregular whitespace.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from stacking_analysis.io_utils import (ANALYSIS_COLUMNS, _read_atoms_fast,
+                                        _read_atoms_pandas,
+                                        read_structure_file)
+
+
+HEADER = (
+    "ITEM: TIMESTEP\n"
+    "0\n"
+    "ITEM: NUMBER OF ATOMS\n"
+    "{n_atoms}\n"
+    "ITEM: BOX BOUNDS pp pp pp\n"
+    "0.0 100.0\n"
+    "0.0 100.0\n"
+    "-5.0 5.0\n"
+    "ITEM: ATOMS id type x y z\n"
+)
+
+# Spaces, tabs, aligned columns, trailing whitespace and CRLF line endings
+MIXED_ATOMS = (
+    "1 1 0.5 1.25 -0.75\n"
+    "2\t4\t10.125\t-3.5\t2.0\n"
+    "3   2   1e-3   2.5E+1   -0.0  \n"
+    "  4 4 7.0 8.0 9.0\t\r\n"
+    "5 3\t +42.75  0.001  3\r\n"
+    "123456789 127 99.999 -99.999 0.1 \n"
+)
+
+EXPECTED = pd.DataFrame({
+    'id': np.array([1, 2, 3, 4, 5, 123456789], dtype=np.int64),
+    'type': np.array([1, 4, 2, 4, 3, 127], dtype=np.int8),
+    'x': np.array([0.5, 10.125, 1e-3, 7.0, 42.75, 99.999], dtype=np.float32),
+    'y': np.array([1.25, -3.5, 25.0, 8.0, 0.001, -99.999], dtype=np.float32),
+    'z': np.array([-0.75, 2.0, -0.0, 9.0, 3.0, 0.1], dtype=np.float32),
+})
+
+
+def _write_dump(path, atoms):
+    n_atoms = len(atoms.splitlines())
+    path.write_bytes((HEADER.format(n_atoms=n_atoms) + atoms).encode())
+    return str(path)
+
+
+@pytest.fixture
+def mixed_dump(tmp_path):
+    return _write_dump(tmp_path / 'mixed.dump', MIXED_ATOMS)
+
+
+def test_mixed_whitespace_parsers_agree(mixed_dump):
+    columns = list(ANALYSIS_COLUMNS)
+    fast = _read_atoms_fast(mixed_dump, 9, columns, ANALYSIS_COLUMNS)
+    slow = _read_atoms_pandas(mixed_dump, 9, columns, ANALYSIS_COLUMNS)
+
+    # The compiled parser must handle the file rather than defer to pandas
+    assert fast is not None
+    pd.testing.assert_frame_equal(fast, EXPECTED)
+    pd.testing.assert_frame_equal(slow, EXPECTED)
+    pd.testing.assert_frame_equal(read_structure_file(mixed_dump), EXPECTED)
+
+
+def test_out_of_range_type_is_rejected(tmp_path):
+    path = _write_dump(tmp_path / 'big_type.dump',
+                       "1 1 0 0 0\n2 200 0 0 0\n3 4 1 2 3\n")
+    columns = list(ANALYSIS_COLUMNS)
+
+    # The compiled parser defers the file to the general parsers
+    assert _read_atoms_fast(path, 9, columns, ANALYSIS_COLUMNS) is None
+    with pytest.raises(ValueError, match='200'):
+        _read_atoms_pandas(path, 9, columns, ANALYSIS_COLUMNS)
+    with pytest.raises(ValueError, match='200'):
+        read_structure_file(path)